@@ -6,22 +6,26 @@
 # @Software: PyCharm
 """通过串口发送测试指令，通过modbus读取数据并解析，主要参数为电池电压，电流，电阻，温度，功率"""
 import datetime
+import logging
+import os
 import queue
-import threading
-
-import openpyxl
-from openpyxl.styles import Alignment, Font, PatternFill, GradientFill, Border, colors, Side
-from tqdm import tqdm
-import random
 import time
 
-import serial
-import modbus_tk.defines as cst
-from modbus_tk import modbus_rtu
-import serial.tools.list_ports
 import configparser
 
 from LogFormat import LogFormat
+from report_writer import XlsxReportWriter
+from result_model import TestResult, NodeCapture, merge_verdict
+from frame_recorder import FrameRecorder
+from checkpoint import CheckpointStore
+from metrics import CONNECT_SECONDS, NODE_WAIT_SECONDS, DECODE_SECONDS, REPORT_SECONDS, TESTS, CANCEL_SECONDS
+from connection_pool import POOL
+from modbus_transport import ModbusTransportError
+from register_planner import ReadPlanner, MAX_READ_REGISTERS
+from wait_scheduler import NodeWaitScheduler
+from bus_scheduler import CAPTURE_PRIORITY, DEFAULT_PRIORITY
+from judgement import JudgementEngine, default_rules
+from cancellation import CancelToken, TestCancelled
 
 log = LogFormat('UPS3072Adapter', "UPS3072Adapter.log")
 logger = log.logger
@@ -29,12 +33,26 @@ logger = log.logger
 
 
 class UPS3072Adapter(object):
-    def __init__(self, file_path):
+    def __init__(self, file_path, section='UPS3072Adapter', addr=None):
+        """
+        :param section: 配置段名称
+        :param addr: 从站地址，为None时使用配置中的addr；同一总线多台设备时每个地址一个适配器
+        """
         self.temp_range = None
         self.v_range = None
         self.config_path = file_path
+        # 配置段名称，多工位时每个工位对应一个配置段，同时作为工位名称
+        self.section = section
+        # 工位名称，同一配置段多个从站时为"配置段@地址"
+        self.name = section if addr is None else f"{section}@{addr}"
         self.port = None
         self.addr = None
+        # 同一总线上的从站地址列表，为空时只有addr一台设备
+        self.slaves = None
+        # 当前请求的总线优先级
+        self.priority = DEFAULT_PRIORITY
+        # 当前测试的取消标志
+        self.token = CancelToken()
         # 波特率
         self.baud_rate = None
         self.timeout = None
@@ -45,13 +63,58 @@ class UPS3072Adapter(object):
         self.parity = None
         # 停止位
         self.stop_bits = None
-        self.modbus_rtu_obj = None
+        # 单帧失败重试次数、首次重试等待(秒)
+        self.retries = None
+        self.retry_backoff = None
+        # 等待节点时允许连续轮询失败的次数，超过则终止测试
+        self.max_poll_failures = None
+        self.transport = None
+        # 本次测试各阶段耗时(秒)
+        self.run_timings = {}
+        self.connect_seconds = 0.0
         self.addr_mapping = None
         self.start_addr = None
         self.table_head = None
         self.nodes_list = None
+        # 节点等待的最小/最大轮询间隔(秒)
+        self.poll_min_interval = None
+        self.poll_max_interval = None
+        # 轮询模式 minimal：等待阶段只读触发寄存器；full：每次读取全部寄存器
+        self.poll_mode = None
+        # 等待阶段判断节点的数据帧下标
+        self.trigger_registers = None
+        # 等待阶段同时读取的数据帧下标，实时曲线在等待节点时也有数据
+        self.chart_registers = None
+        self.max_read_registers = None
+        self.planner = None
+        # 是否记录每次轮询的数据帧，及记录文件目录
+        self.record_frames = None
+        self.record_path = None
+        # 是否保存测试断点，及断点文件
+        self.checkpoint = None
+        self.checkpoints = None
+        # 判断规则，未配置时按v_range、temp_range生成默认规则
+        self.judge_rules = None
+        self.engine = None
+        # 是否实时判断每次轮询的数据帧，及上一帧的不合格下标
+        self.judge_frames = None
+        self.frame_failures = []
         self.log_q = queue.Queue()
+        # 结果事件队列：("start", 表头, 数据行, sn, 测试时间)、("node", 节点序号, 节点表头, 节点列数据, 判断结果)、
+        # ("frame", 单调时间戳, 按判断规则换算后的数据帧)
+        self.result_q = queue.Queue()
         self.init_conf()
+        if addr is not None:
+            self.addr = addr
+
+    def _log(self, log_msg, level=logging.INFO):
+        """写日志文件，同时放入界面日志队列"""
+        logger.log(level, log_msg)
+        self.log_q.put((datetime.datetime.now(), level, log_msg))
+
+    def _publish(self, *event):
+        """发布结果事件，供界面逐节点刷新"""
+        self.result_q.put(event)
 
     @staticmethod
     def _version():
@@ -63,267 +126,391 @@ class UPS3072Adapter(object):
         config = configparser.ConfigParser()
         try:
             config.read(self.config_path, encoding='utf-8')
-            self.port = config.get('UPS3072Adapter', 'port')
-            self.baud_rate = config.getint('UPS3072Adapter', 'baud_rate')
-            self.addr = config.getint('UPS3072Adapter', 'addr')
-            self.stop_bits = config.getint('UPS3072Adapter', 'stop_bits')
-            self.parity = config.get('UPS3072Adapter', 'parity')
-            self.start_addr = config.getint('UPS3072Adapter', 'start_addr')
-            self.bytesize = config.getint('UPS3072Adapter', 'bytesize')
-            self.timeout = config.getint('UPS3072Adapter', 'timeout')
-            self.addr_mapping = eval(config.get('UPS3072Adapter', 'addr_mapping'))
-            self.table_head = eval(config.get('UPS3072Adapter', 'table_head'))
-            self.nodes_list = eval(config.get('UPS3072Adapter', 'nodes_list'))
-            self.v_range = config.getint('UPS3072Adapter', 'v_range')
-            self.temp_range = config.getint('UPS3072Adapter', 'temp_range')
-            self.wait_time_out = config.getint('UPS3072Adapter', 'wait_time_out')
+            if self.section != 'UPS3072Adapter':  # 工位配置段只需写差异项，其余沿用[UPS3072Adapter]
+                for key, value in config.items('UPS3072Adapter'):
+                    if not config.has_option(self.section, key):
+                        config.set(self.section, key, value)
+            self.port = config.get(self.section, 'port')
+            self.baud_rate = config.getint(self.section, 'baud_rate')
+            self.addr = config.getint(self.section, 'addr')
+            self.slaves = eval(config.get(self.section, 'slaves', fallback='[]'))
+            self.stop_bits = config.getint(self.section, 'stop_bits')
+            self.parity = config.get(self.section, 'parity')
+            self.start_addr = config.getint(self.section, 'start_addr')
+            self.bytesize = config.getint(self.section, 'bytesize')
+            self.timeout = config.getfloat(self.section, 'timeout')
+            self.retries = config.getint(self.section, 'retries', fallback=3)
+            self.retry_backoff = config.getfloat(self.section, 'retry_backoff', fallback=0.2)
+            self.max_poll_failures = config.getint(self.section, 'max_poll_failures', fallback=10)
+            self.addr_mapping = eval(config.get(self.section, 'addr_mapping'))
+            self.table_head = eval(config.get(self.section, 'table_head'))
+            self.nodes_list = eval(config.get(self.section, 'nodes_list'))
+            self.v_range = config.getint(self.section, 'v_range')
+            self.temp_range = config.getint(self.section, 'temp_range')
+            self.wait_time_out = config.getint(self.section, 'wait_time_out')
+            self.poll_min_interval = config.getfloat(self.section, 'poll_min_interval', fallback=0.5)
+            self.poll_max_interval = config.getfloat(self.section, 'poll_max_interval', fallback=60)
+            self.poll_mode = config.get(self.section, 'poll_mode', fallback='minimal')
+            self.trigger_registers = eval(config.get(self.section, 'trigger_registers', fallback='[35]'))
+            self.chart_registers = eval(config.get(self.section, 'chart_registers', fallback='[34]'))
+            self.max_read_registers = config.getint(self.section, 'max_read_registers', fallback=MAX_READ_REGISTERS)
+            self.record_frames = config.getboolean(self.section, 'record_frames', fallback=False)
+            self.record_path = config.get(self.section, 'record_path', fallback='./records')
+            self.checkpoint = config.getboolean(self.section, 'checkpoint', fallback=True)
+            self.checkpoints = CheckpointStore(config.get(self.section, 'checkpoint_path', fallback='./checkpoints'))
+            judge_rules = config.get(self.section, 'judge_rules', fallback='')
+            self.judge_rules = eval(judge_rules) if judge_rules else default_rules(self.v_range, self.temp_range)
+            self.judge_frames = config.getboolean(self.section, 'judge_frames', fallback=False)
         except Exception as e:
             error_msg = f'加载配置发生错误：{e}'
-            logger.error(error_msg)
-            self.log_q.put(error_msg)
+            self._log(error_msg, logging.ERROR)
             return False, error_msg
 
-    def connect(self):
-        """建立连接"""
+    def connect(self, token=None):
+        """
+        从连接池获取串口长连接，测试前检查连接，不可用时自动重连
+        :param token: CancelToken，连接和之后的测试共用，为None时不可取消
+        """
+        self.token = token or CancelToken()
+        start = time.perf_counter()
         try:
-            # 设定串口为从站
-            ser = serial.Serial(self.port, self.baud_rate, self.bytesize, parity=self.parity, stopbits=self.stop_bits)
-            self.modbus_rtu_obj = modbus_rtu.RtuMaster(ser)
-            self.modbus_rtu_obj.set_timeout(self.timeout)
+            settings = dict(baud_rate=self.baud_rate, bytesize=self.bytesize, parity=self.parity,
+                            stop_bits=self.stop_bits, timeout=self.timeout, retries=self.retries,
+                            retry_backoff=self.retry_backoff)
+            is_ok, data = POOL.acquire(self.port, settings, self.addr, self.start_addr, self.token)
+            if not is_ok:
+                raise ModbusTransportError(data)
+            self.transport = data
+            self.connect_seconds = time.perf_counter() - start
+            CONNECT_SECONDS.observe(self.connect_seconds, station=self.name)
             log_msg = '3702UPS system connect success'
-            self.log_q.put(log_msg)
-            logger.info(log_msg)
+            self._log(log_msg)
             return True, log_msg
+        except TestCancelled as e:
+            log_msg = f"连接已取消:{e}"
+            self._log(log_msg, logging.WARNING)
+            return False, log_msg
         except Exception as e:
             log_msg = '3702UPS system connect failed message %s' % str(e)
-            logger.error(log_msg)
-            self.log_q.put(log_msg)
+            self._log(log_msg, logging.ERROR)
             return False, log_msg
 
-    def read_hold_register(self, excel_file_path, time_str=None, sn=None):
+    def read_hold_register(self, time_str=None, sn=None, resume=False, token=None):
         """
         读保持寄存器 : 03H
-        :param excel_file_path:
         :param time_str: 测试时间字符串
         :param sn: 被测设备唯一标识符
-        :return: (Bool,data) 成功/失败，成功/失败提示信息
+        :param resume: 是否从该SN的断点继续，已采集的节点不再等待
+        :param token: CancelToken，为None时沿用connect的取消标志
+        :return: (Bool,str,TestResult) 成功/失败，成功/失败提示信息，测试结果
         """
-        th = threading.Thread(target=self.write_number)
-        th.start()
-        time.sleep(2)
+        if token is not None:
+            self.token = token
         if not time_str:
             time_str = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        length = len(list(self.addr_mapping.keys()))
-        start_addr = self.start_addr
-        real_value = self.table_head[3]
-        self.table_head.remove(real_value)
+        self.planner = ReadPlanner(self.addr_mapping, self.start_addr, self.trigger_registers, self.poll_mode,
+                                   self.max_read_registers, self.chart_registers)
+        self.engine = JudgementEngine(self.judge_rules, self.planner.length)
+        self.frame_failures = []
+        trigger_index = self.trigger_registers[0]  # 节点判断使用的电压寄存器
         self.nodes_list.sort()
+        checkpoint = self.load_checkpoint(sn) if resume else None
+        if checkpoint:
+            time_str = checkpoint["time_str"]
+        result = self.new_result(time_str, sn)
+        self.run_timings = {"connect": self.connect_seconds, "modbus": 0.0, "decode": 0.0}
+        result.timings = self.run_timings
+        self._publish("start", list(result.header), [list(row) for row in result.rows], sn, time_str)
+        if checkpoint:
+            self.restore_checkpoint(result, checkpoint)
+        recorder = self.open_recorder(result)
         try:
-            new_list = []
             if len(self.nodes_list) == 0:
                 log_msg = f"请配置检测节点"
-                logger.info(log_msg)
-                self.log_q.put(log_msg)
-                return False,log_msg
+                self._log(log_msg)
+                result.message = log_msg
+                return False, log_msg, result
+            captured = set(capture.node_index for capture in result.captures)
+            from tqdm import tqdm  # 控制台进度条，只在测试时导入
             for node_index, node_value in tqdm(enumerate(self.nodes_list)):
+                if node_index in captured:
+                    continue
+                self.token.check()
                 data = []
                 start_time = datetime.datetime.now()
+                wait_start = time.perf_counter()
                 end_time = start_time + datetime.timedelta(minutes=self.wait_time_out)
                 current_time = datetime.datetime.now()
+                scheduler = NodeWaitScheduler(node_value, self.poll_min_interval, self.poll_max_interval)
+                poll_failures = 0
+                # 到达节点后读取全部寄存器的失败次数，与轮询共用上限，轮询成功不清零
+                capture_failures = 0
                 log_msg = f"当前期望节点值:{float(node_value)}"
-                logger.info(log_msg)
-                self.log_q.put(log_msg)
-                return_data = self.modbus_rtu_obj.execute(self.addr, cst.READ_HOLDING_REGISTERS, start_addr, length)
-                real_value = round(float(return_data[35] / 1000), 1)
+                self._log(log_msg)
 
                 while current_time <= end_time:
-                    return_data = self.modbus_rtu_obj.execute(self.addr, cst.READ_HOLDING_REGISTERS, start_addr, length)
-                    real_value = round(float(return_data[35] / 1000), 2)
-                    if real_value > float(node_value):
-                        data = return_data
-                        log_msg = f"当前电压值:{real_value},期望的节点值:{node_value}，实际值高于期望值，将直接读取此时数据,然后等待下一个节点"
-                        logger.info(log_msg)
-                        self.log_q.put(log_msg)
-                        break
-                    elif real_value == float(node_value):
-                        data = return_data
-                        log_msg = f"当前电压值:{real_value},期望的节点值:{node_value},实际值等于期望值，将开始读取此时数据"
-                        logger.info(log_msg)
-                        self.log_q.put(log_msg)
+                    self.token.check()
+                    try:
+                        # 同一总线上接近节点的从站优先轮询
+                        self.priority = self.current_transport().bus.priority(self.addr, scheduler.eta(),
+                                                                              self.poll_max_interval)
+                        return_data = self.planner.poll(self.read_registers)
+                    except ModbusTransportError as e:  # 重试后仍失败，连续失败次数未超限时继续等待
+                        poll_failures += 1
+                        if poll_failures >= self.max_poll_failures:
+                            raise
+                        self._log(f"轮询失败({poll_failures}/{self.max_poll_failures}):{e}", logging.WARNING)
+                        self.token.sleep(self.poll_min_interval)
+                        current_time = datetime.datetime.now()
+                        continue
+                    poll_failures = 0
+                    self._on_frame(recorder, return_data)
+                    real_value = round(float(return_data[trigger_index] / 1000), 2)
+                    scheduler.update(return_data[trigger_index] / 1000)
+                    if real_value >= float(node_value):
+                        self.priority = CAPTURE_PRIORITY
+                        try:
+                            data = self.planner.capture(self.read_registers, return_data)
+                        except ModbusTransportError as e:  # 节点数据读取失败时重新轮询，不放弃已等待的时间
+                            capture_failures += 1
+                            if capture_failures >= self.max_poll_failures:
+                                raise
+                            self._log(f"读取节点数据失败({capture_failures}/{self.max_poll_failures}):{e}",
+                                      logging.WARNING)
+                            self.token.sleep(self.poll_min_interval)
+                            current_time = datetime.datetime.now()
+                            continue
+                        if data is not return_data:
+                            self._on_frame(recorder, data)
+                        if real_value > float(node_value):
+                            log_msg = f"当前电压值:{real_value},期望的节点值:{node_value}，实际值高于期望值，将直接读取此时数据,然后等待下一个节点"
+                        else:
+                            log_msg = f"当前电压值:{real_value},期望的节点值:{node_value},实际值等于期望值，将开始读取此时数据"
+                        self._log(log_msg)
                         break
                     else:
                         current_time = datetime.datetime.now()
-                        log_msg = f'当前电压值:{real_value},期望的节点值:{node_value},等待截至时间:{end_time},waiting......'
-                        logger.info(log_msg)
-                        self.log_q.put(log_msg)
-                        time.sleep(10)
+                        eta = scheduler.eta()
+                        eta_str = "估算中" if eta is None else (current_time + datetime.timedelta(seconds=eta)).strftime("%Y-%m-%d %H:%M:%S")
+                        log_msg = f'当前电压值:{real_value},期望的节点值:{node_value},预计到达时间:{eta_str},等待截至时间:{end_time},waiting......'
+                        self._log(log_msg)
+                        interval = self.current_transport().bus.next_interval(scheduler.next_interval(), eta)
+                        # 不超过等待截止时间
+                        self.token.sleep(max(0.0, min(interval, (end_time - current_time).total_seconds())))
+                        current_time = datetime.datetime.now()
                 else:
                     log_msg = f'等待超时，测试终止！'
-                    logger.info(log_msg)
-                    self.log_q.put(log_msg)
-                    return False, log_msg
+                    self._log(log_msg)
+                    result.message = log_msg
+                    return False, log_msg, result
+                wait_seconds = time.perf_counter() - wait_start
+                self.run_timings[f"wait_node_{node_index + 1}"] = wait_seconds
+                NODE_WAIT_SECONDS.observe(wait_seconds, station=self.name)
                 log_msg = f"开始读取第{node_index + 1}节点"
-                logger.info(log_msg)
-                self.log_q.put(log_msg)
-                v_sum = float(sum(data[35:52]))  # 电压之和
-                v_menu = round(float(sum(data[35:52]) / 16000), 3)  # 电压平均值
-                temp_menu = round(float(sum(data[52:]) / 160), 1)  # 温度平均值
-                standar_str = f"{real_value}({node_value})\n[标准值:电压：{v_menu}±{self.v_range}V;温度：{temp_menu}±{self.temp_range}℃]]"
-                self.table_head.insert(3 + node_index, standar_str)
-                if node_index == 0:  # 第一个节点，从配置文件里读取数据列表，并填充值
-                    for data_index, item in enumerate(data):
-                        code = data_index + 1
-                        dict_key = str(data_index + self.start_addr)
-                        value_list = self.addr_mapping.get(dict_key, [])
-                        add_items = len(self.nodes_list)
-                        for i in range(0, add_items - 1):  # 先把所有列补出来
-                            value_list.insert(-2, "")  # 序号","测试项目","方法","实测值1","实测值2","实测值3","结果判断","描述
-                        value_list.insert(0, code)
-                        new_list.append(value_list)
-
-                for data_index, item in enumerate(data):
-                    code = data_index + 1
-                    if code == 35:  # 总电压
-                        item = round(float(item / 1000), 3)
-                        new_list[data_index][3 + node_index] = item
-                        if abs(item - v_sum) <= self.v_range:
-                            new_list[data_index][-2] = "合格"
-                        else:
-                            new_list[data_index][-2] = "不合格"
-                    elif 35 <= code <= 51:  # 电压
-                        item = round(float(item / 1000), 3)
-                        new_list[data_index][3 + node_index] = item
-                        if abs(item - v_menu) <= self.v_range:
-                            new_list[data_index][-2] = "合格"
-                        else:
-                            new_list[data_index][-2] = "不合格"
-                    elif 52 <= code <= 67:  # 温度
-                        item = round(float(item / 10), 1)
-                        new_list[data_index][3 + node_index] = item
-                        if abs(item - temp_menu) <= self.temp_range:
-                            new_list[data_index][-2] = "合格"
-                        else:
-                            new_list[data_index][-2] = "不合格"
-                    else:  # 其他
-                        new_list[data_index][3 + node_index] = item
-                log_msg = f"第{node_index + 1}个节点数据已读取,{new_list}"
-                logger.info(log_msg)
-                self.log_q.put(log_msg)
-            log_msg = f"测试完成,获取到测试结果:{new_list},"
-            logger.info(log_msg)
-            self.log_q.put(log_msg)
+                self._log(log_msg)
+                decode_start = time.perf_counter()
+                capture = NodeCapture(node_index, node_value, real_value, data)
+                self.judge_node(result, capture)
+                result.add_capture(capture)
+                decode_seconds = time.perf_counter() - decode_start
+                self.run_timings["decode"] += decode_seconds
+                DECODE_SECONDS.observe(decode_seconds, station=self.name)
+                self._publish("node", node_index, result.header[3 + node_index],
+                              [row[3 + node_index] for row in result.rows], result.verdicts())
+                self.save_checkpoint(result)
+                log_msg = f"第{node_index + 1}个节点数据已读取,{result.rows}"
+                self._log(log_msg)
+            transactions, total_bytes = self.planner.stats()
+            log_msg = f"通信统计:轮询模式{self.poll_mode},事务数{transactions},字节数{total_bytes}"
+            self._log(log_msg)
+            self._log("耗时统计:" + ",".join(f"{key} {value:.3f}s" for key, value in self.run_timings.items()))
+            log_msg = f"测试完成,获取到测试结果:{result.rows},"
+            self._log(log_msg)
+            result.is_ok = True
+            if self.checkpoint_enabled(sn):
+                self.checkpoints.remove(self.name, sn)
+        except TestCancelled as e:  # 已采集的节点已保存断点，结果由界面保存到历史库
+            latency = self.token.latency()
+            CANCEL_SECONDS.observe(latency, station=self.name)
+            log_msg = f"{e},已采集{len(result.captures)}个节点,取消耗时{latency * 1000:.0f}ms"
+            self._log(log_msg, logging.WARNING)
+            result.cancelled = True
+            result.message = log_msg
+            return False, log_msg, result
         except Exception as e:
             log_msg = '测试出错: %s' % str(e)
-            logger.error(log_msg)
-            self.log_q.put(log_msg)
-            return False, log_msg
-        else:
-            try:
-                self.write_to_file(self.table_head, new_list, excel_file_path, time_str, sn)
-                log_msg += "生成报告成功"
-                logger.info(log_msg)
-                self.log_q.put(log_msg)
-                return True, log_msg
-            except Exception as e:
-                log_msg += f"生成报告出错:{e}"
-                logger.info(log_msg)
-                self.log_q.put(log_msg)
-                return False, log_msg
+            self._log(log_msg, logging.ERROR)
+            result.message = log_msg
+            return False, log_msg, result
+        finally:
+            if recorder:
+                recorder.close()
+            status = "ok" if result.is_ok else ("cancelled" if result.cancelled else "fail")
+            TESTS.inc(station=self.name, result=status)
+        result.message = log_msg
+        return True, log_msg, result
+
+    def checkpoint_enabled(self, sn):
+        """SN为空时不保存断点，否则所有空SN的测试共用一个断点文件"""
+        return bool(self.checkpoint) and bool(sn)
 
-    def write_number(self):
-        for node_index, node_value in enumerate(self.nodes_list):
-            logger.info(f"写入第{node_index + 1}节点")
-            for j in range(0, 70):
-                random_num = 1
-                if node_index == 0:
-                    random_num = random.randint(3200, 3220)
-                elif node_index == 1:
-                    random_num = random.randint(3300, 3320)
-                elif node_index == 2:
-                    random_num = random.randint(3400, 3420)
-                elif node_index == 3:
-                    random_num = random.randint(3500, 3520)
-                self.modbus_rtu_obj.execute(1, cst.WRITE_SINGLE_REGISTER, j, output_value=random_num)
-            time.sleep(10)
+    def has_checkpoint(self, sn):
+        """该SN是否有未完成的测试断点"""
+        return self.checkpoint_enabled(sn) and self.checkpoints.exists(self.name, sn)
 
-    def write_to_file(self,table_head, data_list, excel_file_path, time_str, sn=None):
-        """写入excel文件"""
-        wb = openpyxl.Workbook()
-        sheet = wb.active
-        table_head_font = Font(
-            name="微软雅黑",  # 字体
-            size=16,  # 字体大小
-            bold=True,  # 是否加粗，True/False
-            italic=False,  # 是否斜体，True/False
-            strike=None,  # 是否使用删除线，True/False
-            underline=None,  # 下划线, 可选'singleAccounting', 'double', 'single', 'doubleAccounting'
-        )
-        # 自定义字体样式
-        font = Font(
-            name="微软雅黑",  # 字体
-            size=13,  # 字体大小
-            bold=False,  # 是否加粗，True/False
-            italic=False,  # 是否斜体，True/False
-            strike=None,  # 是否使用删除线，True/False
-            underline=None,  # 下划线, 可选'singleAccounting', 'double', 'single', 'doubleAccounting'
-        )
+    def load_checkpoint(self, sn):
+        """读取断点，节点配置与当前不一致时不能继续，return: 断点数据或None"""
+        if not self.checkpoint_enabled(sn):
+            return None
+        checkpoint = self.checkpoints.load(self.name, sn)
+        if checkpoint is None:
+            self._log(f"SN:{sn}没有可继续的测试断点，重新开始测试", logging.WARNING)
+            return None
+        if checkpoint["nodes"] != [float(node_value) for node_value in sorted(self.nodes_list)]:
+            self._log(f"断点节点{checkpoint['nodes']}与当前配置不一致，重新开始测试", logging.WARNING)
+            return None
+        return checkpoint
 
-        fill = PatternFill(
-            patternType="solid",  # 填充类型，可选none、solid、darkGray、mediumGray、lightGray、lightDown、lightGray、lightGrid
-            fgColor="99CCFF",  # 前景色，16进制rgb
-            bgColor="99CCFF",  # 背景色，16进制rgb
-            # fill_type=None,     # 填充类型
-            # start_color=None,   # 前景色，16进制rgb
-            # end_color=None      # 背景色，16进制rgb
-        )
-        border = Border(top=Side(border_style="thin", color=colors.BLACK),
-                        bottom=Side(border_style="thin", color=colors.BLACK),
-                        left=Side(border_style="thin", color=colors.BLACK),
-                        right=Side(border_style="thin", color=colors.BLACK))
-        table_border = Border(top=Side(border_style="medium", color=colors.BLACK),
-                              bottom=Side(border_style="medium", color=colors.BLACK),
-                              left=Side(border_style="medium", color=colors.BLACK),
-                              right=Side(border_style="medium", color=colors.BLACK))
-        sheet.column_dimensions["A"].width = 10
-        sheet.column_dimensions["B"].width = 30
-        sheet.column_dimensions["C"].width = 20
-        sheet.column_dimensions["D"].width = 30
-        sheet.column_dimensions["E"].width = 30
-        sheet.column_dimensions["F"].width = 30
-        sheet.column_dimensions["G"].width = 20
-        sheet.column_dimensions["H"].width = 100
-        sheet.cell(1, 1).value = "SN:"
-        sheet.cell(1, 1).font = table_head_font
-        sheet.cell(1, 2).value = sn
-        sheet.cell(1, 2).font = table_head_font
-        sheet.cell(1, 3).value = "测试日期:"
-        sheet.cell(1, 3).font = table_head_font
-        sheet.cell(1, 4).value = time_str
-        sheet.cell(1, 4).font = table_head_font
+    def restore_checkpoint(self, result, checkpoint):
+        """按断点中的原始数据帧重新判断已采集的节点，并刷新界面"""
+        result.timings.update((key, value) for key, value in checkpoint["timings"].items() if key.startswith("wait_"))
+        for item in checkpoint["captures"]:
+            capture = NodeCapture(item["node_index"], item["node_value"], item["real_value"], item["frame"],
+                                  item["capture_time"])
+            self.judge_node(result, capture)
+            result.add_capture(capture)
+            node_index = capture.node_index
+            self._publish("node", node_index, result.header[3 + node_index],
+                          [row[3 + node_index] for row in result.rows], result.verdicts())
+        self._log(f"从断点继续测试,已采集{len(result.captures)}个节点,测试时间:{result.time_str}")
 
-        for index, item in enumerate(table_head):
-            cell = sheet.cell(row=2, column=index + 1)
-            sheet.cell(row=1, column=index + 1).fill = fill
-            sheet.cell(row=1, column=index + 1).border = table_border
-            cell.value = item
-            cell.font = table_head_font
-            cell.fill = fill
-            cell.border = table_border
-            cell.alignment = Alignment(wrapText=True)
+    def save_checkpoint(self, result):
+        """保存断点，写入失败不影响测试"""
+        if not self.checkpoint_enabled(result.sn):
+            return
+        try:
+            self.checkpoints.save(self.name, result, self.nodes_list)
+        except Exception as e:
+            self._log(f"保存断点出错:{e}", logging.ERROR)
+
+    def _on_frame(self, recorder, frame):
+        """每读到一帧数据：换算后发布给界面实时曲线，按配置写入记录文件"""
+        timestamp = time.monotonic()
+        self._publish("frame", timestamp, self.engine.decode_frame(frame))
+        if self.judge_frames:
+            self.judge_frame(frame)
+        if recorder:
+            recorder.append(timestamp, frame)
+
+    def open_recorder(self, result):
+        """按配置打开轮询数据记录文件，未开启或打开失败时返回None"""
+        if not self.record_frames:
+            return None
+        time_file_str = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+        # 与断点文件一致，工位名、SN中文件名不能出现的字符替换掉，避免SN中的路径分隔符写到记录目录之外
+        file_name = f"{CheckpointStore.safe_name(self.name)}_SN_{CheckpointStore.safe_name(result.sn)}_{time_file_str}"
+        file_path = os.path.join(self.record_path, f"{file_name}.frames")
+        try:
+            os.makedirs(self.record_path, exist_ok=True)
+            recorder = FrameRecorder(file_path, self.planner.length, self.start_addr)
+        except Exception as e:
+            self._log(f"打开轮询记录文件出错:{e}", logging.ERROR)
+            return None
+        result.frames_path = file_path
+        self._log(f"轮询数据记录到:{file_path}")
+        return recorder
+
+    def new_result(self, time_str, sn):
+        """按配置生成空的测试结果：表头"实测值"替换为每个节点一列；数据行从寄存器映射复制"""
+        header = list(self.table_head)
+        header[3:4] = [str(node_value) for node_value in self.nodes_list]
+        rows = []
+        for data_index in range(self.planner.length):
+            code = data_index + 1
+            dict_key = str(data_index + self.start_addr)
+            value_list = list(self.addr_mapping.get(dict_key, ["", "", "", "", ""]))
+            for i in range(0, len(self.nodes_list) - 1):  # 先把所有列补出来
+                value_list.insert(-2, "")  # 序号","测试项目","方法","实测值1","实测值2","实测值3","结果判断","描述
+            value_list.insert(0, code)
+            rows.append(value_list)
+        return TestResult(sn, time_str, header, rows)
+
+    def judge_node(self, result, capture):
+        """
+        按节点采集数据填充结果列并判断
+        :param result: TestResult
+        :param capture: NodeCapture
+        """
+        node_index = capture.node_index
+        judgement = self.engine.evaluate([capture.frame])
+        standar_str = f"{capture.real_value}({capture.node_value})\n[标准值:{self.engine.describe(judgement, 0)}]"
+        result.header[3 + node_index] = standar_str
+        values = self.engine.row_values(judgement, 0, capture.frame)
+        for data_index, verdict in enumerate(judgement.verdicts(0)):
+            result.rows[data_index][3 + node_index] = values[data_index]
+            result.rows[data_index][-2] = merge_verdict(result.rows[data_index][-2], verdict)
+            capture.verdicts.append(verdict)
+
+    def judge_frame(self, frame):
+        """实时判断轮询到的数据帧，不合格项变化时记录日志"""
+        failures = self.engine.evaluate([frame]).failures(0)
+        if failures != self.frame_failures:
+            self.frame_failures = failures
+            if failures:
+                items = ",".join(self.addr_mapping.get(str(self.start_addr + i), [str(i)])[0] for i in failures)
+                self._log(f"实时判断不合格:{items}", logging.WARNING)
+            else:
+                self._log("实时判断全部合格")
+
+    def write_report(self, result, file_path, writer=None):
+        """
+        生成测试报告，由界面放到后台执行
+        :param writer: 报告输出对象，默认xlsx
+        :return: (Bool,data) 成功/失败，成功/失败提示信息
+        """
+        writer = writer or XlsxReportWriter()
+        start = time.perf_counter()
+        try:
+            self.write_to_file(result.header, result.rows, file_path, result.time_str, result.sn, writer)
+            report_seconds = time.perf_counter() - start
+            result.report_path = file_path
+            result.timings["report"] = report_seconds
+            REPORT_SECONDS.observe(report_seconds, format=writer.extension.lstrip("."))
+            log_msg = f"生成报告成功:{file_path},耗时{report_seconds:.3f}s"
+            self._log(log_msg)
+            return True, log_msg
+        except Exception as e:
+            log_msg = f"生成报告出错:{e}"
+            self._log(log_msg, logging.ERROR)
+            return False, log_msg
+
+    def current_transport(self):
+        """同一串口的其他工位重连后连接池中是新的传输层，每次请求前从连接池取，不沿用已关闭的旧连接"""
+        transport = POOL.get(self.port)
+        if transport is not None:
+            self.transport = transport
+        return self.transport
+
+    def read_registers(self, address, quantity):
+        """读保持寄存器 : 03H，供读取规划调用"""
+        start = time.perf_counter()
+        try:
+            return self.current_transport().read_holding_registers(self.addr, address, quantity, self.priority,
+                                                                   self.token)
+        finally:
+            self.run_timings["modbus"] = self.run_timings.get("modbus", 0.0) + time.perf_counter() - start
 
-        for row_index, data_item in enumerate(data_list):
-            for col_index, data in enumerate(data_item):
-                cell = sheet.cell(row=row_index + 3, column=col_index + 1)
-                cell.value = data
-                cell.font = font
-                cell.border = border
-        wb.save(excel_file_path)
-        log_msg = f"写入Excel文件：{excel_file_path}"
-        logger.info(log_msg)
-        self.log_q.put(log_msg)
+    def write_to_file(self, table_head, data_list, excel_file_path, time_str, sn=None, writer=None):
+        """写入报告文件，默认xlsx"""
+        writer = writer or XlsxReportWriter()
+        writer.write(table_head, data_list, excel_file_path, time_str, sn)
+        log_msg = f"写入报告文件：{excel_file_path}"
+        self._log(log_msg)
 
 
 if __name__ == "__main__":
     a = UPS3072Adapter("./conf/UPS3072Adapter.conf")
     a.connect()
-    a.read_hold_register("./data.xlsx")
+    is_ok, msg, test_result = a.read_hold_register()
+    if is_ok:
+        a.write_report(test_result, "./data.xlsx")
@@ -0,0 +1,195 @@
+# -- coding: utf-8 --
+# @info:
+# @Author : liyahui
+# @Time : 2023/7/14 上午9:50
+# @File : batch_export.py
+# @Software: PyCharm
+
+"""批量导出：从历史库重新生成每台设备的报告(进程池并行)，并生成批次汇总工作簿(单元列表、寄存器合格率、节点分布)
+用法：python batch_export.py --db ./history/results.db --date-from 2023-07-14 --output ./export"""
+import argparse
+import datetime
+import itertools
+import os
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from LogFormat import LogFormat
+from checkpoint import CheckpointStore
+from report_writer import get_report_writer, XlsxReportWriter
+from results_db import ResultsDatabase, verdict_text
+
+log = LogFormat('batch_export', "batch_export.log")
+logger = log.logger
+
+
+def export_one(report_format, header, rows, file_path, time_str, sn):
+    """子进程中生成单个报告，return: (报告路径, 耗时秒)"""
+    start = time.perf_counter()
+    get_report_writer(report_format).write(header, rows, file_path, time_str, sn)
+    return file_path, time.perf_counter() - start
+
+
+def percentile(values, ratio):
+    """values已排序"""
+    return values[min(len(values) - 1, int(len(values) * ratio))]
+
+
+class BatchExporter(object):
+    def __init__(self, db, output_dir, report_format="xlsx", max_workers=None):
+        """
+        :param db: 测试结果历史库ResultsDatabase
+        :param output_dir: 报告输出目录
+        :param max_workers: 进程数，默认CPU核数
+        """
+        self.db = db
+        self.output_dir = output_dir
+        self.report_format = report_format
+        self.max_workers = max_workers
+        self.extension = get_report_writer(report_format).extension
+
+    def export(self, run_ids, reports=True, summary=True):
+        """
+        批量导出
+        :param reports: 是否重新生成每台设备的报告
+        :param summary: 是否生成批次汇总
+        :return: (Bool,str) 成功/失败，提示信息
+        """
+        if not run_ids:
+            return False, "没有可导出的测试记录"
+        os.makedirs(self.output_dir, exist_ok=True)
+        start = time.perf_counter()
+        msgs = []
+        is_ok = True
+        if reports:
+            done, errors = self.export_reports(run_ids)
+            msgs.append(f"报告{done}份")
+            if errors:
+                is_ok = False
+                msgs.append(f"失败{len(errors)}份:{errors[0]}")
+        if summary:
+            try:
+                msgs.append(f"汇总:{self.write_summary(run_ids)}")
+            except Exception as e:
+                is_ok = False
+                msgs.append(f"汇总出错:{e}")
+        log_msg = f"批量导出{len(run_ids)}条记录,{','.join(msgs)},耗时{time.perf_counter() - start:.1f}s"
+        logger.info(log_msg)
+        return is_ok, log_msg
+
+    def export_reports(self, run_ids):
+        """
+        进程池并行生成报告，历史库只在主进程读取
+        :return: (成功数, [错误信息])
+        """
+        done = 0
+        errors = []
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {}
+            for run_id in run_ids:
+                result = self.db.load_result(run_id)
+                time_file_str = result.time_str.replace(" ", "-").replace(":", "-")
+                # 同一SN同一秒可能有多条记录(多工位、重测)，文件名带上run_id避免互相覆盖
+                file_name = f"SN_{CheckpointStore.safe_name(result.sn)}_{time_file_str}_{run_id}{self.extension}"
+                file_path = os.path.join(self.output_dir, file_name)
+                future = executor.submit(export_one, self.report_format, result.header, result.rows, file_path,
+                                         result.time_str, result.sn)
+                futures[future] = run_id
+            for future in as_completed(futures):
+                run_id = futures[future]
+                try:
+                    file_path, elapsed = future.result()
+                except Exception as e:
+                    errors.append(f"run_id={run_id}:{e}")
+                    logger.error(f"导出run_id={run_id}出错:{e}")
+                    continue
+                self.db.update_report_path(run_id, file_path)
+                done += 1
+                logger.debug(f"导出run_id={run_id}:{file_path},{elapsed * 1000:.0f}ms")
+        return done, errors
+
+    def write_summary(self, run_ids, file_path=None):
+        """批次汇总工作簿，return: 文件路径"""
+        import openpyxl
+        from openpyxl.cell import WriteOnlyCell
+        if file_path is None:
+            time_file_str = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+            file_path = os.path.join(self.output_dir, f"LOT_{time_file_str}.xlsx")
+        runs = self.db.lot_runs(run_ids)
+        wb = openpyxl.Workbook(write_only=True)
+        XlsxReportWriter.add_styles(wb)
+
+        def add_sheet(title, head, rows, widths):
+            sheet = wb.create_sheet(title)
+            for column, width in zip("ABCDEFGHIJKL", widths):
+                sheet.column_dimensions[column].width = width
+            sheet.append([self.styled_cell(sheet, WriteOnlyCell, value, "report_head") for value in head])
+            for row in rows:
+                sheet.append([self.styled_cell(sheet, WriteOnlyCell, value, "report_cell") for value in row])
+
+        passed = sum(1 for run in runs if run[4] and run[5])
+        finished = sum(1 for run in runs if run[4])
+        cancelled = sum(1 for run in runs if run[6])
+        times = [run[3] for run in runs]
+        add_sheet("汇总", ["项目", "值"], [
+            ["测试数量", len(runs)],
+            ["完成数量", finished],
+            ["停止数量", cancelled],
+            ["合格数量", passed],
+            ["合格率", f"{passed / len(runs):.2%}" if runs else ""],
+            ["开始时间", min(times) if times else ""],
+            ["结束时间", max(times) if times else ""],
+        ], (20, 30))
+        add_sheet("单元列表", ["ID", "SN", "工位", "测试时间", "结果"],
+                  [[run[0], run[1], run[2], run[3], verdict_text(run[4], run[5], run[6])] for run in runs],
+                  (10, 30, 20, 25, 12))
+        add_sheet("寄存器合格率", ["寄存器", "测试项目", "判断台数", "合格台数", "合格率"],
+                  [[register, item, total, passed_count, f"{passed_count / total:.2%}"]
+                   for register, item, total, passed_count in self.db.pass_rates(run_ids)], (10, 30, 12, 12, 12))
+        add_sheet("节点分布", ["节点", "寄存器", "测试项目", "数量", "最小值", "P5", "中位数", "平均值", "P95", "最大值",
+                           "标准差"], self.node_distribution(run_ids), (10, 10, 30, 10, 12, 12, 12, 12, 12, 12, 12))
+        wb.save(file_path)
+        return file_path
+
+    @staticmethod
+    def styled_cell(sheet, cell_class, value, style):
+        cell = cell_class(sheet, value=value)
+        cell.style = style
+        return cell
+
+    def node_distribution(self, run_ids):
+        """各节点各寄存器测量值分布"""
+        rows = []
+        values_list = self.db.node_values(run_ids)
+        for (node_index, node_value, register, item), group in itertools.groupby(values_list,
+                                                                                 key=lambda row: row[:4]):
+            values = sorted(row[4] for row in group)
+            rows.append([node_value if node_value is not None else node_index + 1, register, item, len(values),
+                         values[0], percentile(values, 0.05), statistics.median(values),
+                         round(statistics.fmean(values), 4), percentile(values, 0.95), values[-1],
+                         round(statistics.pstdev(values), 4)])
+        return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="UPS3072批量导出")
+    parser.add_argument("--db", default="./history/results.db")
+    parser.add_argument("--sn", default="", help="SN前缀")
+    parser.add_argument("--date-from", default="", help="起始日期 YYYY-MM-DD")
+    parser.add_argument("--date-to", default="", help="截止日期 YYYY-MM-DD")
+    parser.add_argument("--output", default="./export", help="输出目录")
+    parser.add_argument("--format", default="xlsx", help="报告格式 xlsx/csv/jsonl/parquet")
+    parser.add_argument("--workers", type=int, default=None, help="进程数，默认CPU核数")
+    parser.add_argument("--no-reports", action="store_true", help="只生成批次汇总")
+    args = parser.parse_args()
+    db = ResultsDatabase(args.db)
+    run_ids = [run["id"] for run in db.search(args.sn, args.date_from, args.date_to, limit=-1)]
+    exporter = BatchExporter(db, args.output, args.format, args.workers)
+    is_ok, msg = exporter.export(run_ids, reports=not args.no_reports)
+    db.close()
+    print(msg)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+# -- coding: utf-8 --
+# @info:
+# @Author : liyahui
+# @Time : 2023/7/5 下午3:20
+# @File : benchmark.py
+# @Software: PyCharm
+
+"""性能基准：基于伪终端模拟器测轮询吞吐、单帧解析判断耗时、报告生成耗时、界面表格加载耗时，结果输出为json便于版本间对比
+用法：python benchmark.py --output bench.json"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from judgement import JudgementEngine
+from register_planner import ReadPlanner
+from report_writer import get_report_writer, REPORT_WRITERS
+from result_model import NodeCapture
+from ups3072_simulator import UPS3072Simulator, UnitModel, ChargeCurve
+from UPS3072Adapter import UPS3072Adapter
+
+
+def timeit(fn, repeat):
+    """return: 每次耗时列表(秒)"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def summary(samples):
+    """耗时统计(毫秒)"""
+    samples = sorted(samples)
+    return {
+        "mean_ms": statistics.mean(samples) * 1000,
+        "p50_ms": samples[len(samples) // 2] * 1000,
+        "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000,
+        "max_ms": samples[-1] * 1000,
+        "n": len(samples),
+    }
+
+
+def synthetic_frame(length, cell_mv=3300):
+    """按寄存器布局生成一帧数据：电压mV、温度0.1℃"""
+    frame = [0] * length
+    for index in range(35, min(51, length)):
+        frame[index] = cell_mv + index % 5
+    if length > 34:
+        frame[34] = sum(frame[35:51])
+    for index in range(51, min(67, length)):
+        frame[index] = 250 + index % 3
+    return frame
+
+
+def bench_poll(adapter, baud_rates, seconds, station_counts):
+    """轮询吞吐：每个工位一个模拟器和传输层，按波特率模拟线速"""
+    from modbus_transport import ModbusTransport
+    results = []
+    for baud_rate in baud_rates:
+        for station_count in station_counts:
+            simulators = []
+            transports = []
+            for _ in range(station_count):
+                simulator = UPS3072Simulator({adapter.addr: UnitModel(ChargeCurve())}, baud_rate=baud_rate)
+                port = simulator.start()
+                transport = ModbusTransport(port, baud_rate, timeout=1.0, retries=0)
+                transport.open()
+                simulators.append(simulator)
+                transports.append(transport)
+            for mode in ("minimal", "full"):
+                counts = [0] * station_count
+                latencies = [[] for _ in range(station_count)]
+                deadline = time.monotonic() + seconds
+                planner = ReadPlanner(adapter.addr_mapping, adapter.start_addr, adapter.trigger_registers, mode,
+                                      adapter.max_read_registers, adapter.chart_registers)
+
+                def worker(index):
+                    def read_fn(address, quantity):
+                        return transports[index].read_holding_registers(adapter.addr, address, quantity)
+
+                    while time.monotonic() < deadline:
+                        start = time.perf_counter()
+                        planner.poll(read_fn)
+                        latencies[index].append(time.perf_counter() - start)
+                        counts[index] += 1
+
+                threads = [threading.Thread(target=worker, args=(i,)) for i in range(station_count)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                all_latencies = [value for values in latencies for value in values]
+                results.append({
+                    "name": "poll_throughput",
+                    "params": {"baud_rate": baud_rate, "stations": station_count, "poll_mode": mode,
+                               "registers": sum(quantity for _, quantity in planner.trigger_plan)},
+                    "polls_per_second": sum(counts) / seconds,
+                    "latency": summary(all_latencies) if all_latencies else None,
+                })
+            for transport in transports:
+                transport.close()
+            for simulator in simulators:
+                simulator.stop()
+    return results
+
+
+def bench_judge(adapter, repeat, batch_sizes=(100, 10000)):
+    """单帧解析判断耗时，及批量判断(历史重新判断)每帧耗时"""
+    adapter.planner = ReadPlanner(adapter.addr_mapping, adapter.start_addr, adapter.trigger_registers)
+    adapter.engine = JudgementEngine(adapter.judge_rules, adapter.planner.length)
+    frame = synthetic_frame(adapter.planner.length)
+    result = adapter.new_result("", "bench")
+
+    def judge():
+        capture = NodeCapture(0, adapter.nodes_list[0], 3.3, frame)
+        adapter.judge_node(result, capture)
+
+    results = [{"name": "judge_frame", "params": {"registers": len(frame)}, "latency": summary(timeit(judge, repeat))}]
+    for batch_size in batch_sizes:
+        frames = [synthetic_frame(adapter.planner.length, 3300 + i % 50) for i in range(batch_size)]
+        samples = timeit(lambda: adapter.engine.evaluate(frames), max(1, repeat // 50))
+        results.append({"name": "judge_batch", "params": {"frames": batch_size, "registers": len(frame)},
+                        "latency": summary(samples),
+                        "frames_per_second": batch_size / statistics.mean(samples)})
+    return results
+
+
+def synthetic_table(node_count, row_count):
+    """return: (表头, 数据行)"""
+    header = ["序号", "测试项目", "方法"] + [f"节点{i + 1}" for i in range(node_count)] + ["结果判断", "描述"]
+    rows = [[i + 1, f"项目{i}", "自检"] + [3.3 + j * 0.1 for j in range(node_count)] + ["合格", "描述"]
+            for i in range(row_count)]
+    return header, rows
+
+
+def bench_report(node_counts, row_counts, repeat):
+    """报告生成耗时，按格式、节点数、行数"""
+    results = []
+    directory = tempfile.mkdtemp(prefix="ups_bench_")
+    cases = [(node_count, row_count) for node_count in node_counts for row_count in row_counts]
+    for report_format in REPORT_WRITERS:
+        writer = get_report_writer(report_format)
+        file_path = os.path.join(directory, f"bench{writer.extension}")
+        for node_count, row_count in cases:
+            header, rows = synthetic_table(node_count, row_count)
+            try:
+                samples = timeit(lambda: writer.write(header, rows, file_path, "2023-07-05 15:20:00", "bench"),
+                                 repeat)
+            except Exception as e:  # 可选依赖未安装，跳过该格式
+                results.append({"name": "report_write", "params": {"format": report_format}, "error": str(e)})
+                break
+            results.append({
+                "name": "report_write",
+                "params": {"format": report_format, "nodes": node_count, "rows": row_count},
+                "latency": summary(samples),
+                "bytes": os.path.getsize(file_path),
+            })
+    return results
+
+
+def bench_report_stations(config_path, station_counts, node_count, row_count, repeat):
+    """多个工位同时完成测试时的报告耗时：各工位同时通过StationManager的报告线程池生成报告，
+    统计每份报告从提交到完成的延迟和全部完成的总耗时"""
+    from station_manager import StationManager
+    from result_model import TestResult
+    results = []
+    directory = tempfile.mkdtemp(prefix="ups_bench_")
+    header, rows = synthetic_table(node_count, row_count)
+    for report_format in REPORT_WRITERS:
+        writer = get_report_writer(report_format)
+        for station_count in station_counts:
+            manager = StationManager(config_path, [], max_workers=station_count)
+            names = [f"bench{i + 1}" for i in range(station_count)]
+            for name in names:
+                manager.stations[name] = UPS3072Adapter(config_path)
+            latencies = []
+            makespans = []
+            try:
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    futures = []
+                    for name in names:
+                        result = TestResult(name, "2023-07-05 15:20:00", list(header), rows)
+                        file_path = os.path.join(directory, f"{name}{writer.extension}")
+                        future = manager.submit_report(name, result, file_path, writer)
+                        future.add_done_callback(lambda _, t0=start: latencies.append(time.perf_counter() - t0))
+                        futures.append(future)
+                    outcomes = [future.result() for future in futures]
+                    makespans.append(time.perf_counter() - start)
+                    errors = [log_msg for is_ok, log_msg in outcomes if not is_ok]
+                    if errors:
+                        raise RuntimeError(errors[0])
+            except Exception as e:  # 可选依赖未安装，跳过该格式
+                results.append({"name": "report_stations", "params": {"format": report_format}, "error": str(e)})
+                break
+            finally:
+                manager.shutdown(wait=True)
+            results.append({
+                "name": "report_stations",
+                "params": {"format": report_format, "stations": station_count, "nodes": node_count,
+                           "rows": row_count},
+                "latency": summary(latencies),
+                "makespan": summary(makespans),
+                "reports_per_second": station_count * repeat / sum(makespans),
+            })
+    return results
+
+
+def bench_treeview(row_counts, node_count, repeat):
+    """界面表格加载耗时，无显示环境时跳过"""
+    try:
+        import tkinter as tk
+        from tkinter import ttk
+        from virtual_table import VirtualTable
+        root = tk.Tk()
+    except Exception as e:
+        return [{"name": "treeview_load", "error": str(e)}]
+    results = []
+    columns = tuple(range(5 + node_count))
+    tree_view = ttk.Treeview(root, columns=columns, show="headings")
+    virtual_table = VirtualTable(root, height=20)
+    virtual_table.set_columns([str(column) for column in columns])
+    for row_count in row_counts:
+        rows = [tuple([i] + ["x"] * (len(columns) - 1)) for i in range(row_count)]
+
+        def load():
+            tree_view.delete(*tree_view.get_children())
+            for row in rows:
+                tree_view.insert("", "end", values=row)
+            root.update_idletasks()
+
+        def load_virtual():
+            virtual_table.set_rows(rows)
+            virtual_table.scroll(row_count // 2)
+            root.update_idletasks()
+
+        results.append({"name": "treeview_load", "params": {"rows": row_count, "nodes": node_count},
+                        "latency": summary(timeit(load, repeat))})
+        results.append({"name": "virtual_table_load", "params": {"rows": row_count, "nodes": node_count},
+                        "latency": summary(timeit(load_virtual, repeat))})
+    root.destroy()
+    return results
+
+
+def bench_startup(repeat):
+    """冷启动导入耗时：每次用新的解释器导入界面模块，不创建窗口"""
+    results = []
+    for module in ("performance_testing", "station_manager"):
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            completed = subprocess.run([sys.executable, "-c", f"import {module}"], capture_output=True, text=True)
+            elapsed = time.perf_counter() - start
+            if completed.returncode != 0:
+                error = completed.stderr.strip().splitlines()
+                results.append({"name": "startup_import", "params": {"module": module},
+                                "error": error[-1] if error else f"exit {completed.returncode}"})
+                break
+            samples.append(elapsed)
+        else:
+            results.append({"name": "startup_import", "params": {"module": module}, "latency": summary(samples)})
+    return results
+
+
+def parse_numbers(text):
+    return [int(item) for item in text.split(",") if item.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="UPS3072性能基准")
+    parser.add_argument("--config", default="./conf/UPS3072Adapter.conf")
+    parser.add_argument("--bauds", default="9600,19200,115200", help="轮询吞吐测试的波特率")
+    parser.add_argument("--stations", default="1,4,8", help="并发工位数，用于轮询吞吐和多工位报告测试")
+    parser.add_argument("--seconds", type=float, default=5, help="每组轮询测试时长(秒)")
+    parser.add_argument("--nodes", default="1,3,10", help="报告节点数")
+    parser.add_argument("--rows", default="70,700,7000", help="报告/表格行数")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--skip", default="",
+                        help="跳过的项目，逗号分隔：poll,judge,report,report_stations,treeview,startup")
+    parser.add_argument("--output", default="", help="结果json文件，默认输出到控制台")
+    args = parser.parse_args()
+    skip = set(args.skip.split(","))
+    adapter = UPS3072Adapter(args.config)
+    results = []
+    if "judge" not in skip:
+        results += bench_judge(adapter, args.repeat * 50)
+    if "report" not in skip:
+        results += bench_report(parse_numbers(args.nodes), parse_numbers(args.rows), args.repeat)
+    if "report_stations" not in skip:
+        results += bench_report_stations(args.config, parse_numbers(args.stations), max(parse_numbers(args.nodes)),
+                                         min(parse_numbers(args.rows)), max(1, args.repeat // 4))
+    if "treeview" not in skip:
+        results += bench_treeview(parse_numbers(args.rows), max(parse_numbers(args.nodes)), args.repeat)
+    if "startup" not in skip:
+        results += bench_startup(min(args.repeat, 10))
+    if "poll" not in skip:
+        results += bench_poll(adapter, parse_numbers(args.bauds), args.seconds, parse_numbers(args.stations))
+    output = {
+        "version": UPS3072Adapter._version(),
+        "time": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    text = json.dumps(output, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# -- coding: utf-8 --
+# @info:
+# @Author : liyahui
+# @Time : 2023/7/18 上午10:20
+# @File : bus_scheduler.py
+# @Software: PyCharm
+
+"""RS-485总线调度：同一串口上多个从站共用一个传输层，按距离下个节点的远近和各从站占用的总线时间给请求排优先级，
+总线繁忙时拉长远离节点的从站的轮询间隔"""
+import threading
+import time
+from collections import deque
+
+# 节点采集读取，总是最先发送
+CAPTURE_PRIORITY = -1.0
+# 普通请求(连接检查等)
+DEFAULT_PRIORITY = 0.0
+
+
+class BusScheduler(object):
+    def __init__(self, window=30.0, target_utilization=0.8):
+        """
+        :param window: 统计总线占用的时间窗口(秒)
+        :param target_utilization: 总线占用率目标，超过时拉长远离节点的从站的轮询间隔
+        """
+        self.window = window
+        self.target_utilization = target_utilization
+        # 从站 -> deque[(完成时间, 占用秒数)]
+        self.usage = {}
+        self.lock = threading.Lock()
+
+    def record(self, slave, seconds, now=None):
+        """记录一次事务占用的总线时间"""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.usage.setdefault(slave, deque()).append((now, seconds))
+
+    def _busy(self, now):
+        """窗口内各从站占用秒数，调用方需持有锁"""
+        busy = {}
+        for slave, items in self.usage.items():
+            while items and items[0][0] < now - self.window:
+                items.popleft()
+            if items:
+                busy[slave] = sum(seconds for _, seconds in items)
+        return busy
+
+    def utilization(self, now=None):
+        """窗口内总线占用率"""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            return sum(self._busy(now).values()) / self.window
+
+    def share(self, slave, now=None):
+        """return: (该从站占用份额, 平均份额)"""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            busy = self._busy(now)
+        total = sum(busy.values())
+        if not total:
+            return 0.0, 1.0
+        return busy.get(slave, 0.0) / total, 1.0 / len(busy)
+
+    def priority(self, slave, eta, default_eta=60.0):
+        """
+        轮询优先级，数值越小越先发送
+        :param eta: 预计到达下个节点的秒数，None表示还在估算
+        :param default_eta: 估算中时使用的秒数
+        """
+        base = default_eta if eta is None else max(0.0, eta)
+        share, fair = self.share(slave)
+        # 占用超过平均份额的从站按超出比例降低优先级
+        return (base + 1.0) * max(1.0, share / fair)
+
+    def next_interval(self, interval, eta):
+        """总线占用率超过目标时，拉长离节点还远的从站的轮询间隔；接近节点的从站保持快速轮询"""
+        utilization = self.utilization()
+        if utilization <= self.target_utilization or (eta is not None and eta <= 2 * interval):
+            return interval
+        return interval * utilization / self.target_utilization
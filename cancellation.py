@@ -0,0 +1,62 @@
+# -- coding: utf-8 --
+# @info:
+# @Author : liyahui
+# @Time : 2023/7/20 上午9:10
+# @File : cancellation.py
+# @Software: PyCharm
+
+"""协作式取消：测试线程在每个循环、等待和Modbus请求处检查取消标志，停止测试后在POLL_SECONDS内退出"""
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+# 等待Modbus请求结果时检查取消标志的周期(秒)，决定取消的最大响应延迟
+POLL_SECONDS = 0.05
+
+
+class TestCancelled(Exception):
+    """测试被取消"""
+
+
+class CancelToken(object):
+    def __init__(self):
+        self.event = threading.Event()
+        self.reason = ""
+        self.cancel_time = None
+
+    def cancel(self, reason="测试已取消"):
+        if not self.event.is_set():
+            self.reason = reason
+            self.cancel_time = time.perf_counter()
+            self.event.set()
+
+    def is_cancelled(self):
+        return self.event.is_set()
+
+    def check(self):
+        """已取消时抛出TestCancelled"""
+        if self.event.is_set():
+            raise TestCancelled(self.reason)
+
+    def sleep(self, seconds):
+        """可被取消的等待"""
+        if seconds > 0:
+            self.event.wait(seconds)
+        self.check()
+
+    def wait_future(self, future):
+        """
+        等待请求结果，取消时不再等待：排队中的请求直接撤销，正在收发的请求由I/O线程完成，不会打断串口上的帧
+        :return: future结果
+        """
+        while True:
+            self.check()
+            try:
+                return future.result(timeout=POLL_SECONDS)
+            except FutureTimeoutError:
+                if self.event.is_set():
+                    future.cancel()
+
+    def latency(self):
+        """return: 从取消到现在的秒数"""
+        return 0.0 if self.cancel_time is None else time.perf_counter() - self.cancel_time
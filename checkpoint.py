@@ -0,0 +1,96 @@
+# -- coding: utf-8 --
+# @info:
+# @Author : liyahui
+# @Time : 2023/7/17 上午9:15
+# @File : checkpoint.py
+# @Software: PyCharm
+
+"""测试断点：每采集到一个节点就把已采集的节点数据原子写入断点文件，程序退出或串口掉线后可按SN继续测试"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+from LogFormat import LogFormat
+
+log = LogFormat('checkpoint', "checkpoint.log")
+logger = log.logger
+
+
+class CheckpointStore(object):
+    def __init__(self, directory):
+        """
+        :param directory: 断点文件目录，每个工位每个SN一个文件
+        """
+        self.directory = directory
+
+    @staticmethod
+    def safe_name(name):
+        """文件名中不能出现的字符(路径分隔符、冒号等)替换为_，替换过的加上原名的摘要，避免不同SN对应同一文件"""
+        safe = re.sub(r"[^\w.@-]", "_", name)
+        if safe != name:
+            safe += "_" + hashlib.sha1(name.encode("utf-8")).hexdigest()[:8]
+        return safe
+
+    def path(self, station, sn):
+        return os.path.join(self.directory, f"{self.safe_name(station)}_SN_{self.safe_name(sn)}.json")
+
+    def save(self, station, result, nodes_list):
+        """
+        原子写入：先写同目录临时文件并落盘，再替换正式文件，写到一半断电不会损坏已有断点
+        :param result: TestResult
+        :param nodes_list: 本次测试的节点列表，继续测试时节点配置必须一致
+        """
+        data = {
+            "station": station,
+            "sn": result.sn,
+            "time_str": result.time_str,
+            "nodes": [float(node_value) for node_value in nodes_list],
+            "frames_path": result.frames_path,
+            "timings": result.timings,
+            "captures": [{
+                "node_index": capture.node_index,
+                "node_value": capture.node_value,
+                "real_value": capture.real_value,
+                "capture_time": capture.capture_time,
+                "frame": capture.frame,
+            } for capture in result.captures],
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        file_path = self.path(station, result.sn)
+        fd, tmp_path = tempfile.mkstemp(prefix=".checkpoint_", suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, file_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        logger.info(f"保存断点:{file_path},已采集{len(result.captures)}个节点")
+        return file_path
+
+    def load(self, station, sn):
+        """return: 断点数据，没有或损坏时返回None"""
+        file_path = self.path(station, sn)
+        if not os.path.exists(file_path):
+            return None
+        try:
+            with open(file_path, encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"读取断点{file_path}出错:{e}")
+            return None
+
+    def exists(self, station, sn):
+        return os.path.exists(self.path(station, sn))
+
+    def remove(self, station, sn):
+        """测试完成后删除断点"""
+        file_path = self.path(station, sn)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+            logger.info(f"删除断点:{file_path}")
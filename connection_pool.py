@@ -0,0 +1,131 @@
+# -- coding: utf-8 --
+# @info:
+# @Author : liyahui
+# @Time : 2023/7/10 上午9:40
+# @File : connection_pool.py
+# @Software: PyCharm
+
+"""串口连接池：每个串口保持一个长连接，测试前用一次寄存器读取检查连接，串口断开时按退避重连，退出程序时统一关闭"""
+import threading
+import time
+
+from LogFormat import LogFormat
+from cancellation import TestCancelled
+from modbus_transport import ModbusTransport, is_link_error
+
+log = LogFormat('connection_pool', "connection_pool.log")
+logger = log.logger
+
+
+class SerialConnectionPool(object):
+    def __init__(self, reconnect_attempts=5, base_backoff=0.5, max_backoff=30.0):
+        """
+        :param reconnect_attempts: 检查失败后的最大重连次数
+        :param base_backoff: 首次重连前等待(秒)，之后每次加倍
+        :param max_backoff: 重连等待上限(秒)
+        """
+        self.reconnect_attempts = reconnect_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.connections = {}
+        self.lock = threading.Lock()
+        # 每个串口一把锁，同一串口的打开/检查/重连串行进行
+        self.port_locks = {}
+
+    def _port_lock(self, port):
+        with self.lock:
+            return self.port_locks.setdefault(port, threading.Lock())
+
+    def _open(self, port, settings):
+        transport = ModbusTransport(port, **settings)
+        transport.open()
+        self.connections[port] = transport
+        logger.info(f"{port}连接已打开")
+        return transport
+
+    def _close(self, port):
+        transport = self.connections.pop(port, None)
+        if transport is not None:
+            try:
+                transport.close()
+            except Exception as e:
+                logger.error(f"{port}关闭连接出错:{e}")
+
+    @staticmethod
+    def probe(transport, slave, address, token=None):
+        """读一个寄存器检查连接，return: 失败时的异常，成功返回None"""
+        try:
+            transport.read_holding_registers(slave, address, 1, token=token)
+            return None
+        except TestCancelled:
+            raise
+        except Exception as e:
+            logger.warning(f"{transport.port}从站{slave}连接检查失败:{e}")
+            return e
+
+    @staticmethod
+    def link_down(transport, error):
+        """串口本身不可用(I/O线程已退出或串口读写错误)时才需要重连，从站无响应不影响同一串口上的其他从站"""
+        return not transport.is_open() or is_link_error(error)
+
+    def get(self, port):
+        """return: 串口当前的连接，同一串口的其他工位重连后为新的传输层，没有时返回None"""
+        return self.connections.get(port)
+
+    def acquire(self, port, settings, slave, probe_address, token=None):
+        """
+        获取可用连接：已有连接先检查，串口不可用时关闭并按退避重连；串口正常但从站无响应时只返回失败，
+        不关闭同一串口上其他从站正在使用的连接
+        :param settings: ModbusTransport参数(baud_rate, bytesize, parity, stop_bits, timeout, retries, retry_backoff)
+        :param slave: 检查连接使用的从站地址
+        :param probe_address: 检查连接读取的寄存器地址
+        :param token: CancelToken，重连等待中可被取消
+        :return: (Bool,data) 成功返回ModbusTransport，失败返回提示信息
+        """
+        with self._port_lock(port):
+            transport = self.connections.get(port)
+            if transport is not None and transport.is_open():
+                if transport.baud_rate != settings.get("baud_rate"):
+                    logger.warning(f"{port}已按波特率{transport.baud_rate}打开，忽略新的串口参数")
+                error = self.probe(transport, slave, probe_address, token)
+                if error is None:
+                    return True, transport
+                if not self.link_down(transport, error):
+                    return False, f"{port}从站{slave}无响应:{error}"
+            last_error = None
+            for attempt in range(self.reconnect_attempts + 1):
+                if attempt:
+                    backoff = min(self.max_backoff, self.base_backoff * 2 ** (attempt - 1))
+                    if token is not None:
+                        token.sleep(backoff)
+                    else:
+                        time.sleep(backoff)
+                self._close(port)
+                try:
+                    transport = self._open(port, settings)
+                except Exception as e:  # USB转串口掉线时打开失败
+                    last_error = e
+                    logger.warning(f"{port}第{attempt + 1}次打开失败:{e}")
+                    continue
+                error = self.probe(transport, slave, probe_address, token)
+                if error is None:
+                    return True, transport
+                if not self.link_down(transport, error):  # 串口已打开，保留连接供同一串口的其他从站使用
+                    return False, f"{port}从站{slave}无响应:{error}"
+                last_error = error
+            self._close(port)
+            return False, f"{port}重连{self.reconnect_attempts}次后仍不可用:{last_error}"
+
+    def close(self, port):
+        """关闭指定串口"""
+        with self._port_lock(port):
+            self._close(port)
+
+    def close_all(self):
+        """关闭全部串口"""
+        for port in list(self.connections):
+            self.close(port)
+        logger.info("全部串口连接已关闭")
+
+
+POOL = SerialConnectionPool()
@@ -0,0 +1,147 @@
+# -- coding: utf-8 --
+# @info:
+# @Author : liyahui
+# @Time : 2023/6/21 上午10:40
+# @File : frame_recorder.py
+# @Software: PyCharm
+
+"""轮询数据记录：每次轮询的寄存器数据帧加单调时间戳和已读取位图，按定长记录追加到内存映射文件，读取时不复制数据"""
+import mmap
+import struct
+
+MAGIC = b"UPSFRAME"
+# 版本1用0xFFFF表示未读取，与真实值0xFFFF(如带符号位的温度)无法区分；版本2每帧带已读取位图
+VERSION = 2
+# 文件头：魔数8 版本2 寄存器数2 起始地址2 保留2 记录长度4 记录数8，补齐到64字节
+HEADER = struct.Struct("<8sHHHHIQ")
+HEADER_SIZE = 64
+# 版本1文件中未读取的寄存器填充值
+LEGACY_MISSING = 0xFFFF
+
+
+def bitmap_size(n_registers):
+    """已读取位图字节数，第i个寄存器对应第i//8字节的第i%8位"""
+    return (n_registers + 7) // 8
+
+
+class FrameRecorder(object):
+    def __init__(self, file_path, n_registers, start_addr=0, grow_records=4096):
+        """
+        :param file_path: 记录文件路径
+        :param n_registers: 每帧寄存器数量
+        :param start_addr: 数据帧第0个元素对应的寄存器地址
+        :param grow_records: 文件空间不足时每次扩展的记录数
+        """
+        self.file_path = file_path
+        self.n_registers = n_registers
+        self.start_addr = start_addr
+        self.grow_records = grow_records
+        # 时间戳float64 + 寄存器uint16 * n + 已读取位图，未读取的寄存器值为0
+        self.record = struct.Struct(f"<d{n_registers}H{bitmap_size(n_registers)}s")
+        self.count = 0
+        self.capacity = 0
+        self.file = open(file_path, "w+b")
+        self.mm = None
+        self._resize(grow_records)
+
+    def _resize(self, capacity):
+        """扩展文件并重新映射"""
+        if self.mm is not None:
+            self.mm.close()
+        self.file.truncate(HEADER_SIZE + capacity * self.record.size)
+        self.mm = mmap.mmap(self.file.fileno(), 0)
+        self.capacity = capacity
+        self._write_header()
+
+    def _write_header(self):
+        HEADER.pack_into(self.mm, 0, MAGIC, VERSION, self.n_registers, self.start_addr, 0, self.record.size,
+                         self.count)
+
+    def append(self, timestamp, frame):
+        """
+        追加一帧
+        :param timestamp: time.monotonic()时间戳
+        :param frame: 寄存器数据帧，未读取的位置为None
+        """
+        if self.count >= self.capacity:
+            self._resize(self.capacity + self.grow_records)
+        values = [0] * self.n_registers
+        present = bytearray(bitmap_size(self.n_registers))
+        for i, value in enumerate(frame[:self.n_registers]):
+            if value is not None:
+                values[i] = value & 0xFFFF
+                present[i >> 3] |= 1 << (i & 7)
+        self.record.pack_into(self.mm, HEADER_SIZE + self.count * self.record.size, timestamp, *values, present)
+        self.count += 1
+        # 记录数随每帧更新，异常退出时已写入的数据仍可读取
+        struct.pack_into("<Q", self.mm, HEADER.size - 8, self.count)
+
+    def close(self):
+        """截掉未使用的空间并关闭文件"""
+        if self.mm is None:
+            return
+        self.mm.flush()
+        self.mm.close()
+        self.mm = None
+        self.file.truncate(HEADER_SIZE + self.count * self.record.size)
+        self.file.close()
+
+
+class FrameReader(object):
+    """只读映射记录文件，record/registers返回memoryview，不复制数据"""
+
+    def __init__(self, file_path):
+        self.file = open(file_path, "rb")
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.version, self.n_registers, self.start_addr, _, self.record_size, count = HEADER.unpack_from(
+            self.mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"不是轮询记录文件:{file_path}")
+        # 已读取位图在记录中的偏移，版本1没有位图
+        self.bitmap_offset = 8 + 2 * self.n_registers if self.version >= 2 else None
+        # 以文件实际长度为准，防止记录数大于已写入的数据
+        self.count = min(count, (len(self.mm) - HEADER_SIZE) // self.record_size)
+        self.view = memoryview(self.mm)
+
+    def __len__(self):
+        return self.count
+
+    def record(self, index):
+        """第index帧的原始字节"""
+        offset = HEADER_SIZE + index * self.record_size
+        return self.view[offset:offset + self.record_size]
+
+    def timestamp(self, index):
+        """第index帧的时间戳"""
+        return struct.unpack_from("<d", self.mm, HEADER_SIZE + index * self.record_size)[0]
+
+    def registers(self, index):
+        """第index帧的寄存器值，uint16的memoryview(按本机字节序，x86/ARM均为小端)，未读取的位置见present"""
+        return self.record(index)[8:8 + 2 * self.n_registers].cast("H")
+
+    def present(self, index, register_index):
+        """第index帧是否读取了指定寄存器"""
+        base = HEADER_SIZE + index * self.record_size
+        if self.bitmap_offset is None:
+            return struct.unpack_from("<H", self.mm, base + 8 + register_index * 2)[0] != LEGACY_MISSING
+        return bool(self.mm[base + self.bitmap_offset + (register_index >> 3)] >> (register_index & 7) & 1)
+
+    def frame(self, index):
+        """第index帧的寄存器值列表，未读取的位置为None"""
+        values = self.registers(index).tolist()
+        return [value if self.present(index, i) else None for i, value in enumerate(values)]
+
+    def column(self, register_index):
+        """逐帧返回(时间戳, 指定寄存器值)，跳过未读取的值"""
+        offset = 8 + register_index * 2
+        for index in range(self.count):
+            if not self.present(index, register_index):
+                continue
+            base = HEADER_SIZE + index * self.record_size
+            timestamp = struct.unpack_from("<d", self.mm, base)[0]
+            yield timestamp, struct.unpack_from("<H", self.mm, base + offset)[0]
+
+    def close(self):
+        self.view.release()
+        self.mm.close()
+        self.file.close()
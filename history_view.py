@@ -0,0 +1,209 @@
+# -- coding: utf-8 --
+# @info:
+# @Author : liyahui
+# @Time : 2023/7/12 下午4:05
+# @File : history_view.py
+# @Software: PyCharm
+
+"""历史记录窗口：按SN前缀、日期范围查询历史库，查看单次测试表格，多次测试对比，重新导出Excel报告"""
+import datetime
+import threading
+import time
+import tkinter as tk
+import tkinter.messagebox as msgbox
+from tkinter import filedialog
+
+from LogFormat import LogFormat
+from batch_export import BatchExporter
+from report_writer import XlsxReportWriter
+from results_db import verdict_text
+from virtual_table import VirtualTable
+
+log = LogFormat('history_view', "history_view.log")
+logger = log.logger
+
+RUN_COLUMNS = ("ID", "SN", "工位", "测试时间", "结果", "描述")
+COMPARE_COLUMNS = ("ID", "SN", "测试时间", "节点", "寄存器", "测试项目", "测量值", "结果判断")
+
+
+class HistoryWindow(tk.Toplevel):
+    def __init__(self, master, db, font="微软雅黑", report_format="xlsx"):
+        """
+        :param db: 测试结果历史库ResultsDatabase
+        :param report_format: 批量导出的报告格式
+        """
+        super().__init__(master)
+        self.db = db
+        self.font = font
+        self.report_format = report_format
+        self.export_thread = None
+        self.export_result = None
+        self.sn_entry = None
+        self.date_from_entry = None
+        self.date_to_entry = None
+        self.status_label = None
+        self.filter_entry = None
+        self.run_view = None
+        self.detail_view = None
+        # 表格当前显示的记录，滚动记录列表时不重复加载
+        self.detail_run_id = None
+        self.run()
+        self.search()
+
+    def run(self):
+        """界面初始化"""
+        self.title("历史记录")
+        # 第一行：查询条件
+        query_frame = tk.Frame(self)
+        query_frame.grid(row=0, column=0, padx=5, pady=5, sticky="w")
+        tk.Label(query_frame, text="SN:", font=(self.font, 12)).grid(row=0, column=0, padx=5)
+        self.sn_entry = tk.Entry(query_frame, width=30)
+        self.sn_entry.grid(row=0, column=1, padx=5)
+        self.sn_entry.bind('<Return>', lambda event=None: self.search())
+        tk.Label(query_frame, text="日期:", font=(self.font, 12)).grid(row=0, column=2, padx=5)
+        self.date_from_entry = tk.Entry(query_frame, width=12)
+        self.date_from_entry.grid(row=0, column=3)
+        tk.Label(query_frame, text="至").grid(row=0, column=4)
+        self.date_to_entry = tk.Entry(query_frame, width=12)
+        self.date_to_entry.grid(row=0, column=5)
+        # 默认查询最近30天
+        today = datetime.date.today()
+        self.date_from_entry.insert(0, (today - datetime.timedelta(days=30)).strftime("%Y-%m-%d"))
+        self.date_to_entry.insert(0, today.strftime("%Y-%m-%d"))
+        tk.Button(query_frame, text="查询", command=self.search, width=8,
+                  font=(self.font, 12)).grid(row=0, column=6, padx=5)
+        tk.Button(query_frame, text="导出Excel", command=self.export, width=10,
+                  font=(self.font, 12)).grid(row=0, column=7, padx=5)
+        tk.Button(query_frame, text="对比", command=self.compare, width=8,
+                  font=(self.font, 12)).grid(row=0, column=8, padx=5)
+        tk.Button(query_frame, text="批量导出", command=self.batch_export, width=10,
+                  font=(self.font, 12)).grid(row=0, column=9, padx=5)
+        self.status_label = tk.Label(query_frame, text="")
+        self.status_label.grid(row=0, column=10, padx=5)
+        # 第二行：测试记录列表，可多选后对比
+        self.run_view = VirtualTable(self, height=10, selectmode="extended")
+        self.run_view.set_columns(RUN_COLUMNS, widths=(60, 200, 150, 160, 80, 300))
+        self.run_view.grid(row=1, column=0, padx=5, pady=5, sticky="nwse")
+        self.run_view.tree.bind("<<TreeviewSelect>>", lambda event=None: self.show_detail(), add="+")
+        # 第三行：过滤
+        filter_frame = tk.Frame(self)
+        filter_frame.grid(row=2, column=0, padx=5, sticky="w")
+        tk.Label(filter_frame, text="过滤:", font=(self.font, 12)).grid(row=0, column=0, padx=5)
+        self.filter_entry = tk.Entry(filter_frame, width=30)
+        self.filter_entry.grid(row=0, column=1, padx=5)
+        self.filter_entry.bind('<KeyRelease>',
+                               lambda event=None: self.detail_view.set_filter(self.filter_entry.get()))
+        # 第四行：选中记录的结果表格或对比表格
+        self.detail_view = VirtualTable(self, height=20)
+        self.detail_view.grid(row=3, column=0, padx=5, pady=5, sticky="nwse")
+
+    def search(self):
+        """按条件查询"""
+        sn = self.sn_entry.get().strip()
+        date_from = self.date_from_entry.get().strip()
+        date_to = self.date_to_entry.get().strip()
+        start = time.perf_counter()
+        try:
+            runs = self.db.search(sn, date_from, date_to)
+        except Exception as e:
+            msgbox.showinfo(title="提示", message=f"查询出错:{e}", parent=self)
+            return
+        elapsed = (time.perf_counter() - start) * 1000
+        rows = []
+        for run in runs:
+            verdict = verdict_text(run["is_ok"], run["is_pass"], run["cancelled"])
+            rows.append((run["id"], run["sn"], run["station"], run["test_time"], verdict, run["message"]))
+        self.run_view.set_rows(rows)
+        self.status_label['text'] = f"{len(runs)}条记录,{elapsed:.1f}ms"
+        logger.info(f"查询历史记录:sn={sn},{date_from}~{date_to},{len(runs)}条,{elapsed:.1f}ms")
+
+    def selected_runs(self):
+        """return: 选中的run_id列表"""
+        return [row[0] for row in self.run_view.selection()]
+
+    def selected_run(self):
+        """return: 选中的第一个run_id，未选中返回None"""
+        run_ids = self.selected_runs()
+        return run_ids[0] if run_ids else None
+
+    def show_detail(self):
+        """显示选中记录的结果表格"""
+        run_id = self.selected_run()
+        if run_id is None or run_id == self.detail_run_id:
+            return
+        result = self.db.load_result(run_id)
+        if result is None:
+            return
+        self.detail_run_id = run_id
+        self.detail_view.set_columns(result.display_header())
+        self.detail_view.set_rows(result.rows)
+
+    def compare(self):
+        """多次测试对比，每个寄存器每个节点一行"""
+        run_ids = self.selected_runs()
+        if len(run_ids) < 2:
+            msgbox.showinfo(title="提示", message="请选择至少两条记录", parent=self)
+            return
+        start = time.perf_counter()
+        rows = self.db.compare(run_ids)
+        self.detail_view.set_columns(COMPARE_COLUMNS, widths=(60, 200, 160, 80, 80, 200, 100, 100))
+        self.detail_view.set_rows(rows)
+        self.detail_run_id = run_ids[0]
+        elapsed = (time.perf_counter() - start) * 1000
+        self.status_label['text'] = f"对比{len(run_ids)}次测试,{len(rows)}行,{elapsed:.1f}ms"
+        logger.info(f"对比测试记录:{run_ids},{len(rows)}行,{elapsed:.1f}ms")
+
+    def export(self):
+        """将选中记录重新导出为Excel报告"""
+        run_id = self.selected_run()
+        if run_id is None:
+            msgbox.showinfo(title="提示", message="请先选择一条记录", parent=self)
+            return
+        result = self.db.load_result(run_id)
+        time_file_str = result.time_str.replace(" ", "-").replace(":", "-")
+        file_path = filedialog.asksaveasfilename(parent=self, defaultextension=".xlsx",
+                                                 initialfile=f"SN_{result.sn}_{time_file_str}.xlsx",
+                                                 filetypes=[("Excel", "*.xlsx")])
+        if not file_path:
+            return
+        try:
+            XlsxReportWriter().write(result.header, result.rows, file_path, result.time_str, result.sn)
+        except Exception as e:
+            log_msg = f"导出出错:{e}"
+        else:
+            self.db.update_report_path(run_id, file_path)
+            log_msg = f"已导出:{file_path}"
+        logger.info(log_msg)
+        msgbox.showinfo(title="提示", message=log_msg, parent=self)
+
+    def batch_export(self):
+        """查询结果全部重新导出报告并生成批次汇总，后台执行"""
+        if self.export_thread is not None and self.export_thread.is_alive():
+            msgbox.showinfo(title="提示", message="批量导出进行中", parent=self)
+            return
+        run_ids = [row[0] for row in self.run_view.rows]
+        if not run_ids:
+            msgbox.showinfo(title="提示", message="没有可导出的测试记录", parent=self)
+            return
+        output_dir = filedialog.askdirectory(parent=self, title="选择导出目录")
+        if not output_dir:
+            return
+        exporter = BatchExporter(self.db, output_dir, self.report_format)
+
+        def run():
+            self.export_result = exporter.export(run_ids)
+
+        self.export_result = None
+        self.export_thread = threading.Thread(target=run, name="batch-export", daemon=True)
+        self.export_thread.start()
+        self.status_label['text'] = f"正在导出{len(run_ids)}条记录..."
+        self.after(200, self.check_export)
+
+    def check_export(self):
+        """在Tk主线程等待批量导出完成"""
+        if self.export_thread.is_alive():
+            self.after(200, self.check_export)
+            return
+        is_ok, log_msg = self.export_result or (False, "批量导出出错")
+        self.status_label['text'] = "批量导出完成" if is_ok else "批量导出失败"
+        msgbox.showinfo(title="提示", message=log_msg, parent=self)
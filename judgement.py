@@ -0,0 +1,256 @@
+# -- coding: utf-8 --
+# @info:
+# @Author : liyahui
+# @Time : 2023/7/19 上午9:40
+# @File : judgement.py
+# @Software: PyCharm
+
+"""判断引擎：按配置的寄存器规则(上下限、与电池组参考值的偏差、离群分数)用NumPy一次判断多帧数据，
+节点采集、实时轮询帧和历史记录重新判断共用
+用法：python judgement.py --db ./history/results.db --config ./conf/UPS3072Adapter.conf  按当前规则重新判断历史记录"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from result_model import PASS, FAIL
+
+# 判断状态
+NOT_JUDGED = 0
+PASSED = 1
+FAILED = 2
+VERDICTS = {NOT_JUDGED: "", PASSED: PASS, FAILED: FAIL}
+# 浮点比较容差，避免0.1+0.2这类误差导致边界值误判
+EPSILON = 1e-9
+
+
+def default_rules(v_range, temp_range):
+    """
+    默认规则，与原判断逻辑一致：单体电压、温度与各自平均值比较，总电压与单体电压之和比较
+    数据帧下标：34总电压(mV)，35~50单体电压(mV)，51~66温度(0.1℃，第15bit为符号位)
+    """
+    return {
+        "单体电压": {"index": [35, 50], "scale": 0.001, "digits": 3, "unit": "V", "deviation": v_range},
+        "总电压": {"index": [34, 34], "scale": 0.001, "digits": 3, "unit": "V", "deviation": v_range,
+                "reference": "sum:单体电压"},
+        "温度": {"index": [51, 66], "scale": 0.1, "digits": 1, "unit": "℃", "sign_bit": True,
+               "deviation": temp_range},
+    }
+
+
+class JudgeRule(object):
+    def __init__(self, name, index, scale=1.0, digits=3, unit="", sign_bit=False, min=None, max=None,
+                 deviation=None, reference="mean", outlier=None):
+        """
+        :param index: [起始下标, 结束下标]，含两端
+        :param scale: 原始值乘以该系数得到显示值
+        :param sign_bit: 第15bit为符号位(1为负)，其余位为数值
+        :param min: 下限，None不判断
+        :param max: 上限，None不判断
+        :param deviation: 与参考值的最大偏差，None不判断
+        :param reference: 参考值 mean平均值 / median中位数 / sum:规则名 另一规则各值之和
+        :param outlier: 最大离群分数 |x-中位数|/(1.4826*MAD)，None不判断
+        """
+        self.name = name
+        self.first, self.last = index
+        self.scale = scale
+        self.digits = digits
+        self.unit = unit
+        self.sign_bit = sign_bit
+        self.minimum = min
+        self.maximum = max
+        self.deviation = deviation
+        self.reference = reference
+        self.outlier = outlier
+
+    def columns(self, length):
+        """规则在数据帧中的切片，超出帧长度的部分忽略"""
+        return slice(min(self.first, length), min(self.last + 1, length))
+
+
+class Judgement(object):
+    """一批数据帧的判断结果，第i行对应第i帧"""
+
+    def __init__(self, values, status, references):
+        """
+        :param values: 换算后的值 (帧数, 帧长度)，无规则的下标为原始值，缺失为nan
+        :param status: 判断状态 (帧数, 帧长度)
+        :param references: {规则名: 各帧参考值}
+        """
+        self.values = values
+        self.status = status
+        self.references = references
+
+    def verdicts(self, i):
+        """return: 第i帧各下标的判断结果字符串"""
+        return [VERDICTS[code] for code in self.status[i].tolist()]
+
+    def passed(self):
+        """return: 各帧是否全部合格"""
+        return ~(self.status == FAILED).any(axis=1)
+
+    def failures(self, i):
+        """return: 第i帧不合格的下标"""
+        return np.flatnonzero(self.status[i] == FAILED).tolist()
+
+
+class JudgementEngine(object):
+    def __init__(self, rules, length):
+        """
+        :param rules: {规则名: 规则参数}，见JudgeRule
+        :param length: 数据帧长度
+        """
+        self.length = length
+        self.rules = [JudgeRule(name, **spec) for name, spec in rules.items()]
+        self.rules_by_name = {rule.name: rule for rule in self.rules}
+        # 按下标展开换算参数，解码时整帧一次计算
+        self.scale = np.ones(length)
+        self.sign_mask = np.zeros(length, dtype=bool)
+        self.judged = np.zeros(length, dtype=bool)
+        for rule in self.rules:
+            columns = rule.columns(length)
+            self.scale[columns] = rule.scale
+            self.sign_mask[columns] = rule.sign_bit
+            self.judged[columns] = True
+
+    def decode(self, frames):
+        """原始寄存器值换算为显示值，return: (帧数, 帧长度)，缺失(None)为nan"""
+        raw = np.array(frames, dtype=float).reshape(-1, self.length)
+        values = raw.copy()
+        if self.sign_mask.any():
+            signed = raw[:, self.sign_mask]
+            negative = signed >= 0x8000
+            values[:, self.sign_mask] = np.where(negative, -(signed - 0x8000), signed)
+        values[:, self.judged] *= self.scale[self.judged]
+        for rule in self.rules:
+            columns = rule.columns(self.length)
+            values[:, columns] = np.round(values[:, columns], rule.digits)
+        return values
+
+    def decode_frame(self, frame):
+        """单帧换算为显示值(比例、符号位与节点判断一致)，return: list，缺失为None"""
+        return [None if np.isnan(value) else value for value in self.decode([frame])[0].tolist()]
+
+    def reference(self, rule, values):
+        """各帧参考值"""
+        block = values[:, rule.columns(self.length)]
+        with np.errstate(all="ignore"):
+            if rule.reference.startswith("sum:"):
+                other = self.rules_by_name[rule.reference[4:]]
+                reference = np.nansum(values[:, other.columns(self.length)], axis=1)
+            elif rule.reference == "median":
+                reference = np.nanmedian(block, axis=1)
+            else:
+                reference = np.nanmean(block, axis=1)
+        return np.round(reference, rule.digits)
+
+    def evaluate(self, frames):
+        """
+        批量判断，frames可以是多次轮询、多个节点或多台设备的数据帧
+        :param frames: 二维序列 (帧数, 帧长度)，或单帧
+        :return: Judgement
+        """
+        values = self.decode(frames)
+        status = np.zeros(values.shape, dtype=np.int8)
+        references = {}
+        for rule in self.rules:
+            columns = rule.columns(self.length)
+            block = values[:, columns]
+            present = ~np.isnan(block)
+            passed = present.copy()
+            with np.errstate(invalid="ignore"):
+                if rule.minimum is not None:
+                    passed &= block >= rule.minimum - EPSILON
+                if rule.maximum is not None:
+                    passed &= block <= rule.maximum + EPSILON
+                if rule.deviation is not None:
+                    reference = self.reference(rule, values)
+                    references[rule.name] = reference
+                    passed &= np.abs(block - reference[:, None]) <= rule.deviation + EPSILON
+                if rule.outlier is not None:
+                    median = np.nanmedian(block, axis=1, keepdims=True)
+                    mad = np.nanmedian(np.abs(block - median), axis=1, keepdims=True) * 1.4826
+                    score = np.abs(block - median) / np.where(mad > 0, mad, np.inf)
+                    passed &= score <= rule.outlier
+            status[:, columns] = np.where(present, np.where(passed, PASSED, FAILED), NOT_JUDGED)
+        return Judgement(values, status, references)
+
+    def row_values(self, judgement, i, frame):
+        """第i帧写入结果表格的值：有规则的下标为换算值，其余为原始值"""
+        row = list(frame)
+        for rule in self.rules:
+            columns = rule.columns(self.length)
+            for index in range(columns.start, columns.stop):
+                value = judgement.values[i, index]
+                row[index] = None if np.isnan(value) else round(float(value), rule.digits)
+        return row
+
+    def describe(self, judgement, i):
+        """第i帧的标准值说明，用于节点表头"""
+        items = []
+        for rule in self.rules:
+            if rule.name in judgement.references:
+                items.append(f"{rule.name}：{judgement.references[rule.name][i]}±{rule.deviation}{rule.unit}")
+            elif rule.minimum is not None or rule.maximum is not None:
+                items.append(f"{rule.name}：{rule.minimum}~{rule.maximum}{rule.unit}")
+        return ";".join(items)
+
+
+def rejudge_history(db, engine, run_ids):
+    """
+    按当前规则重新判断历史记录，全部节点数据帧一次判断；未完成的测试不论判断项如何都不算合格
+    :return: [(run_id, 原结果是否合格, 新结果是否合格, 不合格下标列表)]
+    """
+    rows = db.capture_frames(run_ids)
+    rows = [row for row in rows if row[2]]
+    if not rows:
+        return []
+    frames = []
+    for _, _, frame in rows:  # 寄存器配置变化后帧长度可能不同，截断或补齐
+        frame = json.loads(frame)[:engine.length]
+        frames.append(frame + [None] * (engine.length - len(frame)))
+    judgement = engine.evaluate(frames)
+    passed = judgement.passed()
+    results = {}
+    for i, (run_id, node_index, _) in enumerate(rows):
+        failures = results.setdefault(run_id, set())
+        if not passed[i]:
+            failures.update(judgement.failures(i))
+    items = []
+    for run_id, _, _, _, is_ok, is_pass, _ in db.lot_runs(list(results)):
+        failures = results[run_id]
+        items.append((run_id, bool(is_ok and is_pass), bool(is_ok) and not failures, sorted(failures)))
+    return items
+
+
+def main():
+    from results_db import ResultsDatabase
+    from UPS3072Adapter import UPS3072Adapter
+    from register_planner import ReadPlanner
+    parser = argparse.ArgumentParser(description="按当前判断规则重新判断历史记录")
+    parser.add_argument("--db", default="./history/results.db")
+    parser.add_argument("--config", default="./conf/UPS3072Adapter.conf")
+    parser.add_argument("--section", default="UPS3072Adapter")
+    parser.add_argument("--sn", default="", help="SN前缀")
+    parser.add_argument("--date-from", default="")
+    parser.add_argument("--date-to", default="")
+    args = parser.parse_args()
+    adapter = UPS3072Adapter(args.config, args.section)
+    length = ReadPlanner(adapter.addr_mapping, adapter.start_addr, adapter.trigger_registers).length
+    engine = JudgementEngine(adapter.judge_rules, length)
+    db = ResultsDatabase(args.db)
+    run_ids = [run["id"] for run in db.search(args.sn, args.date_from, args.date_to, limit=-1)]
+    start = time.perf_counter()
+    results = rejudge_history(db, engine, run_ids)
+    elapsed = time.perf_counter() - start
+    db.close()
+    changed = [item for item in results if item[1] != item[2]]
+    print(f"重新判断{len(results)}条记录,合格{sum(1 for item in results if item[2])}条,"
+          f"结果变化{len(changed)}条,耗时{elapsed * 1000:.0f}ms")
+    for run_id, before, after, failures in changed:
+        print(f"run_id={run_id}:{PASS if before else FAIL} -> {PASS if after else FAIL},不合格下标{failures}")
+
+
+if __name__ == "__main__":
+    main()
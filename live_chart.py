@@ -0,0 +1,163 @@
+# -- coding: utf-8 --
+# @info:
+# @Author : liyahui
+# @Time : 2023/6/25 下午2:00
+# @File : live_chart.py
+# @Software: PyCharm
+
+"""实时曲线：总电压、16节单体电压、16节温度，按时间分桶保留最小/最大值，重绘开销与测试时长无关"""
+import tkinter as tk
+
+# 数据帧下标，对应addr_mapping中"36"总电压、"37"-"52"第1-16节电压、"53"-"68"第1-16节温度
+TOTAL_VOLTAGE_INDEX = 34
+CELL_VOLTAGE_INDEXES = range(35, 51)
+TEMPERATURE_INDEXES = range(51, 67)
+
+COLORS = ["#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd", "#8c564b", "#e377c2", "#7f7f7f",
+          "#bcbd22", "#17becf", "#393b79", "#637939", "#8c6d31", "#843c39", "#7b4173", "#3182bd"]
+
+
+class MinMaxSeries(object):
+    """按时间分桶保存每桶最小/最大值，桶数超过上限时相邻两桶合并、桶宽加倍"""
+
+    def __init__(self, max_buckets=600, bucket_span=1.0):
+        self.max_buckets = max_buckets
+        self.bucket_span = bucket_span
+        self.buckets = []
+
+    def add(self, elapsed, value):
+        """加入一个采样点，elapsed为距测试开始的秒数"""
+        index = int(elapsed / self.bucket_span)
+        while index >= self.max_buckets:
+            self._merge()
+            index = int(elapsed / self.bucket_span)
+        if index >= len(self.buckets):
+            self.buckets.extend([None] * (index + 1 - len(self.buckets)))
+        bucket = self.buckets[index]
+        if bucket is None:
+            self.buckets[index] = [value, value]
+        elif value < bucket[0]:
+            bucket[0] = value
+        elif value > bucket[1]:
+            bucket[1] = value
+
+    def _merge(self):
+        merged = []
+        for i in range(0, len(self.buckets), 2):
+            pair = [bucket for bucket in self.buckets[i:i + 2] if bucket is not None]
+            if pair:
+                merged.append([min(bucket[0] for bucket in pair), max(bucket[1] for bucket in pair)])
+            else:
+                merged.append(None)
+        self.buckets = merged
+        self.bucket_span *= 2
+
+    def duration(self):
+        """已覆盖的时长(秒)"""
+        return len(self.buckets) * self.bucket_span
+
+    def value_range(self):
+        """(最小值, 最大值)，无数据时返回None"""
+        buckets = [bucket for bucket in self.buckets if bucket is not None]
+        if not buckets:
+            return None
+        return min(bucket[0] for bucket in buckets), max(bucket[1] for bucket in buckets)
+
+
+class LiveChart(tk.Canvas):
+    """单个曲线图，多条曲线共用纵轴"""
+
+    def __init__(self, master, title, unit, series_count, max_buckets=600, **kwargs):
+        kwargs.setdefault("background", "white")
+        kwargs.setdefault("height", 200)
+        super().__init__(master, **kwargs)
+        self.title = title
+        self.unit = unit
+        self.max_buckets = max_buckets
+        self.series = [MinMaxSeries(max_buckets) for _ in range(series_count)]
+
+    def add(self, series_index, elapsed, value):
+        self.series[series_index].add(elapsed, value)
+
+    def clear(self):
+        self.series = [MinMaxSeries(self.max_buckets) for _ in self.series]
+        self.delete("all")
+
+    def redraw(self):
+        """按桶绘制：每桶在同一横坐标上画最小、最大两点，每条曲线一次create_line"""
+        self.delete("all")
+        width = max(self.winfo_width(), 100)
+        height = max(self.winfo_height(), 60)
+        left, right, top, bottom = 60, width - 10, 20, height - 20
+        self.create_rectangle(left, top, right, bottom, outline="#999999")
+        self.create_text(left, 2, text=self.title, anchor="nw")
+        ranges = [series.value_range() for series in self.series]
+        ranges = [value_range for value_range in ranges if value_range]
+        if not ranges:
+            return
+        low = min(value_range[0] for value_range in ranges)
+        high = max(value_range[1] for value_range in ranges)
+        if high == low:
+            high, low = high + 0.5, low - 0.5
+        duration = max(series.duration() for series in self.series) or 1.0
+        self.create_text(left - 5, top, text=f"{high:.3g}{self.unit}", anchor="ne")
+        self.create_text(left - 5, bottom, text=f"{low:.3g}{self.unit}", anchor="se")
+        self.create_text(right, bottom + 2, text=f"{duration / 60:.1f}min", anchor="ne")
+        x_scale = (right - left) / duration
+        y_scale = (bottom - top) / (high - low)
+        for series_index, series in enumerate(self.series):
+            points = []
+            for bucket_index, bucket in enumerate(series.buckets):
+                if bucket is None:
+                    continue
+                x = left + bucket_index * series.bucket_span * x_scale
+                points.extend((x, bottom - (bucket[0] - low) * y_scale, x, bottom - (bucket[1] - low) * y_scale))
+            if len(points) >= 4:
+                self.create_line(*points, fill=COLORS[series_index % len(COLORS)])
+
+
+class ChartPanel(tk.Frame):
+    """总电压、单体电压、温度三个曲线图，数据到达时只标记，按redraw_ms节流重绘"""
+
+    def __init__(self, master, max_buckets=600, redraw_ms=1000):
+        super().__init__(master)
+        self.redraw_ms = redraw_ms
+        self.dirty = False
+        # 第一帧的时间戳，各曲线共用同一时间起点
+        self.t0 = None
+        self.total_chart = LiveChart(self, "总电压", "V", 1, max_buckets)
+        self.cell_chart = LiveChart(self, "单体电压", "V", len(CELL_VOLTAGE_INDEXES), max_buckets)
+        self.temp_chart = LiveChart(self, "温度", "℃", len(TEMPERATURE_INDEXES), max_buckets)
+        for row, chart in enumerate((self.total_chart, self.cell_chart, self.temp_chart)):
+            chart.grid(row=row, column=0, sticky="nwse")
+            self.rowconfigure(row, weight=1)
+        self.columnconfigure(0, weight=1)
+        self.after(self.redraw_ms, self.redraw)
+
+    def add_frame(self, timestamp, frame):
+        """加入一帧已按判断规则换算的数据(电压V、温度℃，温度负值已按符号位解码)，未读取的值为None"""
+        if self.t0 is None:
+            self.t0 = timestamp
+        elapsed = timestamp - self.t0
+        if len(frame) > TOTAL_VOLTAGE_INDEX and frame[TOTAL_VOLTAGE_INDEX] is not None:
+            self.total_chart.add(0, elapsed, frame[TOTAL_VOLTAGE_INDEX])
+        for series_index, data_index in enumerate(CELL_VOLTAGE_INDEXES):
+            if data_index < len(frame) and frame[data_index] is not None:
+                self.cell_chart.add(series_index, elapsed, frame[data_index])
+        for series_index, data_index in enumerate(TEMPERATURE_INDEXES):
+            if data_index < len(frame) and frame[data_index] is not None:
+                self.temp_chart.add(series_index, elapsed, frame[data_index])
+        self.dirty = True
+
+    def clear(self):
+        self.t0 = None
+        for chart in (self.total_chart, self.cell_chart, self.temp_chart):
+            chart.clear()
+
+    def redraw(self):
+        """有新数据且页面可见时重绘"""
+        if self.dirty and self.winfo_ismapped():
+            for chart in (self.total_chart, self.cell_chart, self.temp_chart):
+                chart.redraw()
+            self.dirty = False
+        self.after(self.redraw_ms, self.redraw)
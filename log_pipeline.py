@@ -0,0 +1,127 @@
+# -- coding: utf-8 --
+# @info:
+# @Author : liyahui
+# @Time : 2023/6/19 上午9:15
+# @File : log_pipeline.py
+# @Software: PyCharm
+
+"""界面日志：由Tk主循环定时批量取出各工位日志/结果队列，日志框只保留最近若干行并支持按级别过滤"""
+import datetime
+import logging
+import queue
+import tkinter as tk
+from collections import deque
+from tkinter import ttk
+
+from LogFormat import LogFormat
+
+log = LogFormat('log_pipeline', "log_pipeline.log")
+logger = log.logger
+
+LEVELS = ["DEBUG", "INFO", "WARNING", "ERROR"]
+
+
+def parse_log_item(item):
+    """
+    日志队列元素统一为(时间, 级别, 内容)
+    适配器放入(时间, 级别, 内容)，兼容直接放入字符串
+    """
+    if isinstance(item, tuple) and len(item) == 3:
+        return item
+    return datetime.datetime.now(), logging.INFO, str(item)
+
+
+class LogPane(tk.Frame):
+    """日志框：最新日志在最上方，最多保留max_lines行"""
+
+    def __init__(self, master, max_lines=2000, level="INFO", height=10):
+        super().__init__(master)
+        self.max_lines = max_lines
+        self.lines = deque(maxlen=max_lines)
+        self.level_var = tk.StringVar(self, value=level)
+        self.level_box = ttk.Combobox(self, textvariable=self.level_var, values=LEVELS, width=10, state="readonly")
+        self.level_box.bind("<<ComboboxSelected>>", lambda event=None: self.refresh())
+        self.text = tk.Text(self, height=height)
+        self.level_box.grid(row=0, column=0, sticky="w")
+        self.text.grid(row=1, column=0, sticky="nwse")
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(1, weight=1)
+
+    def min_level(self):
+        """当前显示的最低级别"""
+        return logging.getLevelName(self.level_var.get())
+
+    def append(self, items):
+        """批量追加日志队列元素"""
+        min_level = self.min_level()
+        shown = []
+        for created, level, msg in map(parse_log_item, items):
+            line = f"{created.strftime('%Y-%m-%d %H:%M:%S')} {msg}"
+            self.lines.append((level, line))
+            if level >= min_level:
+                shown.append(line)
+        if not shown:
+            return
+        shown.reverse()
+        self.text.insert("1.0", "\n".join(shown) + "\n")
+        self.text.delete(f"{self.max_lines + 1}.0", "end")
+
+    def refresh(self):
+        """级别变化后按保留的日志重新显示"""
+        min_level = self.min_level()
+        shown = [line for level, line in self.lines if level >= min_level]
+        shown.reverse()
+        self.text.delete("1.0", "end")
+        if shown:
+            self.text.insert("1.0", "\n".join(shown) + "\n")
+
+    def clear(self):
+        """清空日志"""
+        self.lines.clear()
+        self.text.delete("1.0", "end")
+
+
+class QueueDispatcher(object):
+    """在Tk主循环中通过after定时取出工作线程的队列，每次每个队列最多取batch_size条交给回调，界面只在主线程更新"""
+
+    def __init__(self, root, poll_ms=200, batch_size=500):
+        self.root = root
+        self.poll_ms = poll_ms
+        self.batch_size = batch_size
+        self.sinks = []
+        self.after_id = None
+
+    def register(self, q, callback):
+        """注册队列和处理回调，callback(items)在Tk主线程执行"""
+        self.sinks.append((q, callback))
+
+    def start(self):
+        """开始定时分发"""
+        if self.after_id is None:
+            self.after_id = self.root.after(self.poll_ms, self.drain)
+
+    def stop(self):
+        """停止分发"""
+        if self.after_id is not None:
+            self.root.after_cancel(self.after_id)
+            self.after_id = None
+
+    def drain(self):
+        """取出各队列中的元素批量交给回调，单个回调出错只记录日志，不影响其他队列和下次分发"""
+        try:
+            for q, callback in self.sinks:
+                items = []
+                while len(items) < self.batch_size:
+                    try:
+                        items.append(q.get_nowait())
+                    except queue.Empty:
+                        break
+                if not items:
+                    continue
+                try:
+                    callback(items)
+                except Exception as e:
+                    logger.exception(f"界面队列回调出错,丢弃{len(items)}条:{e}")
+        finally:
+            if self.after_id is not None:  # 回调中调用了stop时不再分发
+                self.after_id = self.root.after(self.poll_ms, self.drain)
@@ -0,0 +1,171 @@
+# -- coding: utf-8 --
+# @info:
+# @Author : liyahui
+# @Time : 2023/7/7 上午10:10
+# @File : metrics.py
+# @Software: PyCharm
+
+"""运行指标：计数器和耗时直方图，按Prometheus文本格式输出到文件或本地HTTP端口"""
+import bisect
+import os
+import threading
+
+from LogFormat import LogFormat
+
+log = LogFormat('metrics', "metrics.log")
+logger = log.logger
+
+# 默认耗时分桶(秒)，覆盖单帧Modbus事务到数小时的节点等待
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600, 14400, 43200)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class Counter(object):
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(key)} {value}")
+        return lines
+
+
+class Histogram(object):
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        # 标签 -> [各桶计数, 总和, 总数]
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts, total, count = self.values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            if index < len(counts):
+                counts[index] += 1
+            self.values[key] = (counts, total + value, count + 1)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, (counts, total, count) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{self.name}_bucket{format_labels(key + (('le', bound),))} {cumulative}")
+                lines.append(f"{self.name}_bucket{format_labels(key + (('le', '+Inf'),))} {count}")
+                lines.append(f"{self.name}_sum{format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{format_labels(key)} {count}")
+        return lines
+
+
+class MetricsRegistry(object):
+    def __init__(self):
+        self.metrics = []
+        self.server = None
+        self.writer_thread = None
+        self.stop_event = threading.Event()
+
+    def counter(self, name, help_text):
+        metric = Counter(name, help_text)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help_text, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Prometheus文本格式"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, file_path):
+        """原子写入指标文件，供node_exporter textfile采集"""
+        directory = os.path.dirname(file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp_path, file_path)
+
+    def start_textfile_writer(self, file_path, interval=10):
+        """后台定时写指标文件"""
+        def run():
+            while not self.stop_event.wait(interval):
+                try:
+                    self.write_textfile(file_path)
+                except Exception as e:
+                    logger.error(f"写指标文件出错:{e}")
+
+        self.writer_thread = threading.Thread(target=run, name="metrics-writer", daemon=True)
+        self.writer_thread.start()
+        logger.info(f"指标文件:{file_path},每{interval}秒更新")
+
+    def start_http_server(self, port, host="127.0.0.1"):
+        """本地HTTP端口提供/metrics"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # 未开启端口时不导入
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True).start()
+        logger.info(f"指标HTTP端口:{host}:{port}")
+
+    def stop(self):
+        self.stop_event.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server = None
+
+
+REGISTRY = MetricsRegistry()
+
+MODBUS_TRANSACTIONS = REGISTRY.counter("ups_modbus_transactions_total", "Modbus帧收发次数(含重试)")
+MODBUS_ERRORS = REGISTRY.counter("ups_modbus_errors_total", "Modbus帧失败次数")
+MODBUS_RETRIES = REGISTRY.counter("ups_modbus_retries_total", "Modbus帧重试次数")
+MODBUS_BYTES = REGISTRY.counter("ups_modbus_bytes_total", "Modbus收发字节数")
+MODBUS_SECONDS = REGISTRY.histogram("ups_modbus_transaction_seconds", "单帧Modbus事务耗时")
+BUS_SECONDS = REGISTRY.counter("ups_bus_busy_seconds_total", "各从站占用总线时间")
+CONNECT_SECONDS = REGISTRY.histogram("ups_connect_seconds", "建立连接耗时")
+NODE_WAIT_SECONDS = REGISTRY.histogram("ups_node_wait_seconds", "等待到达节点耗时")
+DECODE_SECONDS = REGISTRY.histogram("ups_decode_seconds", "节点数据解析判断耗时")
+REPORT_SECONDS = REGISTRY.histogram("ups_report_seconds", "报告生成耗时")
+TESTS = REGISTRY.counter("ups_tests_total", "测试次数")
+CANCEL_SECONDS = REGISTRY.histogram("ups_cancel_seconds", "停止测试到测试线程退出的耗时",
+                                    (0.01, 0.025, 0.05, 0.1, 0.2, 0.5, 1, 2, 5))
+STARTUP_SECONDS = REGISTRY.histogram("ups_startup_seconds", "程序启动耗时",
+                                     (0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 3, 5, 10, 30))
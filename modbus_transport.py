@@ -0,0 +1,214 @@
+# -- coding: utf-8 --
+# @info:
+# @Author : liyahui
+# @Time : 2023/6/28 上午9:30
+# @File : modbus_transport.py
+# @Software: PyCharm
+
+"""Modbus RTU传输层：专用I/O线程串行收发，支持小数秒超时、失败重试退避、按波特率控制帧间隔，
+多个请求按优先级排队连续发送，同一总线上的多个从站共用"""
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import serial
+import modbus_tk.defines as cst
+from modbus_tk import modbus_rtu
+from modbus_tk.exceptions import ModbusInvalidResponseError
+
+from LogFormat import LogFormat
+from bus_scheduler import BusScheduler, DEFAULT_PRIORITY
+from metrics import MODBUS_TRANSACTIONS, MODBUS_ERRORS, MODBUS_RETRIES, MODBUS_BYTES, MODBUS_SECONDS, BUS_SECONDS
+
+log = LogFormat('modbus_transport', "modbus_transport.log")
+logger = log.logger
+
+# 可重试的错误：CRC错误/响应长度错误/超时无响应、串口读写错误
+RETRY_ERRORS = (ModbusInvalidResponseError, serial.SerialException, OSError)
+# 串口本身不可用的错误(USB转串口掉线等)，区别于从站无响应
+LINK_ERRORS = (serial.SerialException, OSError)
+
+
+def frame_bytes(function_code, quantity_of_x):
+    """(请求字节数, 正常响应字节数)"""
+    if function_code in (cst.READ_HOLDING_REGISTERS, cst.READ_INPUT_REGISTERS):
+        return 8, 5 + 2 * quantity_of_x
+    if function_code in (cst.READ_COILS, cst.READ_DISCRETE_INPUTS):
+        return 8, 5 + (quantity_of_x + 7) // 8
+    if function_code == cst.WRITE_MULTIPLE_REGISTERS:
+        return 9 + 2 * quantity_of_x, 8
+    return 8, 8
+
+
+class ModbusTransportError(Exception):
+    """重试次数用尽仍失败"""
+
+    def __init__(self, message, last_error=None):
+        super().__init__(message)
+        # 最后一次失败的原始异常
+        self.last_error = last_error
+
+
+def is_link_error(error):
+    """是否为串口读写错误；从站无响应、CRC错误时串口本身正常，同一总线上的其他从站不受影响"""
+    return isinstance(error, LINK_ERRORS) or isinstance(getattr(error, "last_error", None), LINK_ERRORS)
+
+
+def frame_gap(baud_rate, bytesize=8, parity='N', stop_bits=1):
+    """RTU帧间隔：3.5个字符时间，波特率高于19200时固定1.75ms"""
+    if baud_rate > 19200:
+        return 0.00175
+    char_bits = 1 + bytesize + (0 if parity == 'N' else 1) + stop_bits
+    return 3.5 * char_bits / baud_rate
+
+
+class ModbusTransport(object):
+    def __init__(self, port, baud_rate, bytesize=8, parity='N', stop_bits=1, timeout=0.5, retries=3,
+                 retry_backoff=0.2):
+        """
+        :param timeout: 单帧响应超时(秒)，可为小数
+        :param retries: 单帧失败后的重试次数
+        :param retry_backoff: 首次重试前等待(秒)，之后每次加倍
+        """
+        self.port = port
+        self.baud_rate = baud_rate
+        self.bytesize = bytesize
+        self.parity = parity
+        self.stop_bits = stop_bits
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.gap = frame_gap(baud_rate, bytesize, parity, stop_bits)
+        self.serial = None
+        self.master = None
+        # (优先级, 序号, future, 请求参数)，同优先级按提交顺序
+        self.requests = queue.PriorityQueue()
+        self.sequence = itertools.count()
+        self.bus = BusScheduler()
+        self.thread = None
+        # 提交请求与关闭互斥
+        self.lock = threading.Lock()
+        self.last_frame_time = 0.0
+        # 统计
+        self.transactions = 0
+        self.retry_count = 0
+        self.error_count = 0
+
+    def open(self):
+        """打开串口并启动I/O线程"""
+        self.serial = serial.Serial(self.port, self.baud_rate, self.bytesize, parity=self.parity,
+                                    stopbits=self.stop_bits, timeout=self.timeout)
+        self.master = modbus_rtu.RtuMaster(self.serial)
+        self.master.set_timeout(self.timeout)
+        self.thread = threading.Thread(target=self._run, name=f"modbus-{self.port}", daemon=True)
+        self.thread.start()
+        logger.info(f"{self.port}传输层已打开,帧间隔{self.gap * 1000:.2f}ms")
+
+    def close(self):
+        """停止I/O线程，未执行的请求以异常结束；串口由I/O线程退出时关闭，不会在正在收发的请求下关闭"""
+        with self.lock:  # 之后提交的请求直接失败，不会排在结束标志之后无人处理
+            thread, self.thread = self.thread, None
+        if thread is None:
+            self._shutdown()
+        else:
+            self.requests.put((float("-inf"), next(self.sequence), None, None))
+            thread.join(timeout=self.timeout * (self.retries + 1) + 1)
+            if thread.is_alive():
+                logger.warning(f"{self.port}I/O线程仍在收发，完成后关闭串口")
+                return
+        logger.info(f"{self.port}传输层已关闭")
+
+    def _shutdown(self):
+        """结束排队中的请求并关闭串口，由I/O线程退出时调用"""
+        while True:
+            try:
+                item = self.requests.get_nowait()
+            except queue.Empty:
+                break
+            if item[2] is not None and item[2].set_running_or_notify_cancel():
+                item[2].set_exception(ModbusTransportError(f"{self.port}传输层已关闭"))
+        if self.master is not None:
+            self.master.close()
+            self.master = None
+
+    def is_open(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def submit(self, slave, function_code, starting_address, quantity_of_x=0, output_value=0,
+               priority=DEFAULT_PRIORITY):
+        """提交请求，return: Future；优先级数值小的先发送，同优先级按提交顺序"""
+        future = Future()
+        with self.lock:
+            if not self.is_open():
+                future.set_exception(ModbusTransportError(f"{self.port}传输层未打开"))
+                return future
+            self.requests.put((priority, next(self.sequence), future,
+                               (slave, function_code, starting_address, quantity_of_x, output_value)))
+        return future
+
+    def execute(self, slave, function_code, starting_address, quantity_of_x=0, output_value=0,
+                priority=DEFAULT_PRIORITY):
+        """同步执行请求，接口与RtuMaster.execute一致"""
+        return self.submit(slave, function_code, starting_address, quantity_of_x, output_value, priority).result()
+
+    def read_holding_registers(self, slave, starting_address, quantity, priority=DEFAULT_PRIORITY, token=None):
+        """读保持寄存器 : 03H，token为CancelToken时等待结果可被取消"""
+        if token is None:
+            return self.execute(slave, cst.READ_HOLDING_REGISTERS, starting_address, quantity, priority=priority)
+        future = self.submit(slave, cst.READ_HOLDING_REGISTERS, starting_address, quantity, priority=priority)
+        return token.wait_future(future)
+
+    def _run(self):
+        try:
+            while True:
+                _, _, future, args = self.requests.get()
+                if future is None:
+                    break
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    future.set_result(self._transact(*args))
+                except Exception as e:
+                    future.set_exception(e)
+        finally:
+            self._shutdown()
+
+    def _transact(self, slave, function_code, starting_address, quantity_of_x, output_value):
+        """收发一帧，可重试错误按退避重试"""
+        last_error = None
+        tx_bytes, rx_bytes = frame_bytes(function_code, quantity_of_x)
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.retry_count += 1
+                MODBUS_RETRIES.inc(port=self.port)
+                time.sleep(self.retry_backoff * 2 ** (attempt - 1))
+            # 帧间隔
+            wait = self.last_frame_time + self.gap - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            start = time.perf_counter()
+            MODBUS_BYTES.inc(tx_bytes, port=self.port, direction="tx")
+            try:
+                if attempt:
+                    # 丢弃残留的错误帧；串口已掉线时同样按可重试错误处理，最终抛出ModbusTransportError
+                    self.serial.reset_input_buffer()
+                response = self.master.execute(slave, function_code, starting_address, quantity_of_x, output_value)
+                MODBUS_BYTES.inc(rx_bytes, port=self.port, direction="rx")
+                MODBUS_TRANSACTIONS.inc(port=self.port, result="ok")
+                return response
+            except RETRY_ERRORS as e:
+                last_error = e
+                MODBUS_TRANSACTIONS.inc(port=self.port, result="error")
+                logger.warning(f"{self.port}从站{slave}第{attempt + 1}次请求失败:{e}")
+            finally:
+                elapsed = time.perf_counter() - start
+                MODBUS_SECONDS.observe(elapsed, port=self.port)
+                BUS_SECONDS.inc(elapsed, port=self.port, slave=slave)
+                self.bus.record(slave, elapsed)
+                self.transactions += 1
+                self.last_frame_time = time.monotonic()
+        self.error_count += 1
+        MODBUS_ERRORS.inc(port=self.port)
+        raise ModbusTransportError(f"{self.port}从站{slave}重试{self.retries}次后仍失败:{last_error}", last_error)
@@ -5,47 +5,253 @@
 # @File : performance_testing.py
 # @Software: PyCharm
 
-"""电池性能测试"""
+"""电池性能测试
+启动时先显示窗口，串口/Modbus相关模块和工位适配器在后台线程加载，Excel、历史查询窗口在用到时才导入"""
+import time
+
+START_TIME = time.perf_counter()
+
 import datetime
 import configparser
 import os.path
 import sys
 import threading
-import time
 import tkinter as tk
 from tkinter import ttk
 from tkinter import *
 import tkinter.messagebox as msgbox
 from LogFormat import LogFormat
-from UPS3072Adapter import UPS3072Adapter
-import openpyxl
+from checkpoint import CheckpointStore
+from live_chart import ChartPanel
+from metrics import REGISTRY, STARTUP_SECONDS
+from log_pipeline import QueueDispatcher, LogPane
+from report_writer import get_report_writer
+from results_db import ResultsDatabase
+from virtual_table import VirtualTable
 
 log = LogFormat('performance_testing', "performance_testing.log")
 logger = log.logger
 
 
-class Performance(tk.Frame):
-    def __init__(self, config_path, master=tk.Tk()):
+class StationTab(tk.Frame):
+    """单个工位页签：SN输入、执行测试、结果表格、日志"""
+
+    def __init__(self, master, name, adapter_object, app):
+        """
+        :param name: 工位名称
+        :param adapter_object: 工位适配器
+        :param app: 主界面Performance，提供工位管理和界面配置
+        """
         super().__init__(master)
+        self.name = name
+        self.adapter_object = adapter_object
+        self.app = app
+        self.manager = app.manager
+        self.filepath = app.filepath
+        self.box_width = app.box_width
+        self.font = app.font
+        self.background = app.background
+        self.report_writer = get_report_writer(app.report_format)
         self.log_text = None
-        self.treeview_scrollbar = None
+        self.result_notebook = None
+        self.chart_panel = None
+        self.result_table = None
+        # 表格模型中第0行为表头行，数据行从第1行开始
+        self.row_count = 0
+        self.entry_box = None
+        self.clear_button = None
+        self.execute_button = None
+        self.stop_button = None
+        self.run()
+
+    def run(self):
+        """页签界面初始化"""
+        # 第一行
+        label = tk.Label(self, text="SN:", font=(self.font, 12))
+
+        self.entry_box = tk.Entry(self, width=self.box_width, highlightcolor='red', highlightthickness=1)
+        self.execute_button = tk.Button(self, text="执行测试", command=self.execute, width=10,
+                                        background=self.background, font=(self.font, 12))
+        self.execute_button.bind('<Return>', lambda event=None: self.execute_button.invoke())
+        self.clear_button = tk.Button(self, text="清空", command=self.clear_input, width=10,
+                                      font=(self.font, 12), background=self.background)
+        self.stop_button = tk.Button(self, text="停止测试", command=self.stop, width=10, state='disable',
+                                     font=(self.font, 12), background=self.background)
+
+        label.grid(row=0, column=0, padx=5, pady=5, sticky="w")
+        self.entry_box.grid(row=0, column=1, padx=5, pady=5, sticky="w")
+        self.execute_button.grid(row=0, column=2, padx=5, pady=5)
+        self.clear_button.grid(row=0, column=3, padx=5, pady=5)
+        self.stop_button.grid(row=0, column=4, padx=5, pady=5)
+        # 第二行
+        result_label = tk.Label(self, text="测试结果", font=(self.font, 12))
+        result_label.grid(row=1, column=0, padx=5, pady=5)
+        # 第三行：结果表格和实时曲线
+        self.result_notebook = ttk.Notebook(self)
+        self.result_notebook.grid(row=2, column=1, columnspan=3, padx=5, pady=5, sticky="nwse")
+        self.result_table = VirtualTable(self.result_notebook, height=20, sortable=False)
+        self.result_table.set_columns(["序号", "测试项目", "方法", "3.2", "3.3", "3.4", "结果判断", "描述"])
+        self.chart_panel = ChartPanel(self.result_notebook, self.app.chart_buckets, self.app.chart_redraw_ms)
+        self.result_notebook.add(self.result_table, text="结果表格")
+        self.result_notebook.add(self.chart_panel, text="实时曲线")
+        # 第四行
+        self.log_text = LogPane(self, self.app.log_max_lines, self.app.log_level)
+        self.log_text.grid(row=3, column=1, columnspan=3, padx=5, pady=5, sticky="nwse")
+
+    def clear_input(self):
+        """清空输入框"""
+        self.entry_box.delete(0, "end")
+        logger.info(f"工位{self.name}清空输入框")
+
+    def clear_text(self):
+        """全部清空"""
+        self.entry_box.delete(0, "end")
+        self.log_text.clear()
+        self.chart_panel.clear()
+        self.result_table.clear()
+        self.row_count = 0
+
+    def execute(self):
+        """执行测试"""
+        sn_text = self.entry_box.get().strip()  # 获取输入框中的文本，去掉两侧的换行符
+        resume = False
+        if not self.manager.is_busy(self.name) and self.adapter_object.has_checkpoint(sn_text):
+            resume = msgbox.askyesno(title="提示", message=f"SN:{sn_text}有未完成的测试，是否从断点继续？")
+        is_ok, data = self.manager.submit(self.name, self.thread_execute, sn_text, resume)
+        if not is_ok:
+            msgbox.showinfo(title="提示", message=data)
+            return
+        self.execute_button['state'] = 'disable'
+        self.stop_button['state'] = 'normal'
+        logger.info(f"工位{self.name}设备:{sn_text},开始测试")
+
+    def stop(self):
+        """停止测试，已采集的节点作为部分结果保存"""
+        is_ok, log_msg = self.manager.cancel(self.name)
+        if not is_ok:
+            msgbox.showinfo(title="提示", message=log_msg)
+            return
+        self.stop_button['state'] = 'disable'
+        if self.manager.futures[self.name].cancelled():  # 还在排队，测试线程不会发送完成事件
+            self.execute_button['state'] = 'normal'
+
+    def thread_execute(self, sn_text, resume=False, token=None):
+        """线程执行测试，resume为True时从断点继续，token为停止测试的取消标志"""
+        time_str = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        time_file_str = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+        # 多个工位可能同时测试同一SN，文件名带上工位名，避免同一秒生成的报告互相覆盖
+        name_prefix = f"{CheckpointStore.safe_name(self.name)}_SN_{CheckpointStore.safe_name(sn_text)}_{time_file_str}"
+        filename = f"{name_prefix}{self.report_writer.extension}"
+        log_msg = ""
+        result = None
+        if not os.path.exists(self.filepath):
+            log_msg = f"找不到文件路径：{self.filepath}"
+        else:
+            abs_filepath = os.path.join(self.filepath, filename)
+            try:
+                is_ok, log_msg = self.adapter_object.connect(token)
+                if is_ok:
+                    is_ok, log_msg, result = self.adapter_object.read_hold_register(time_str, sn_text, resume,
+                                                                                    token)
+            except Exception as e:
+                log_msg = f"执行测试出错:{e}"
+                logger.info(log_msg)
+            else:
+                if is_ok:  # 测试成功，结果已逐节点显示，报告在后台生成
+                    self.manager.submit_report(self.name, result, abs_filepath, self.report_writer)
+                    log_msg = f"测试完成！"
+                elif result is not None and result.cancelled and result.captures:  # 停止测试时生成部分报告
+                    partial_path = os.path.join(self.filepath, f"{name_prefix}_partial{self.report_writer.extension}")
+                    self.manager.submit_report(self.name, result, partial_path, self.report_writer)
+                elif result is not None:  # 测试失败也保存历史记录
+                    self.manager.submit_report(self.name, result)
+
+        logger.info(log_msg)
+        # 完成提示交给Tk主线程处理
+        self.adapter_object.result_q.put(("finish", log_msg))
+
+    def on_result_events(self, events):
+        """在Tk主线程处理结果事件"""
+        for event in events:
+            kind = event[0]
+            if kind == "frame":
+                self.chart_panel.add_frame(*event[1:])
+            elif kind == "start":
+                self.chart_panel.clear()
+                self.render_table(*event[1:])
+            elif kind == "node":
+                self.update_node(*event[1:])
+            elif kind == "finish":
+                self.execute_button['state'] = 'normal'
+                self.stop_button['state'] = 'disable'
+                # 弹窗等待操作员确认，放到分发结束后执行，不阻塞其他工位的日志和结果刷新
+                self.after_idle(self.show_finish, event[1])
+
+    def show_finish(self, log_msg):
+        """测试完成提示"""
+        msgbox.showinfo(title="提示", message=f"{self.name}:{log_msg}")
+
+    def render_table(self, header, rows, sn, time_str):
+        """测试开始时按表头和数据行建表，节点列在采集后逐列填充"""
+        heading = ["SN:", sn, "测试日期:", time_str]
+        self.result_table.set_columns([heading[i] if i < len(heading) else "" for i in range(len(header))])
+        header_row = [str(item).replace("\n", "") for item in header]
+        self.result_table.set_rows([header_row] + list(rows))
+        self.row_count = len(rows)
+
+    def update_node(self, node_index, header_text, values, verdicts):
+        """节点采集完成后原位更新该节点列和判断结果"""
+        if not self.row_count:  # 测试中途清空了表格
+            return
+        column = 3 + node_index
+        self.result_table.update_cell(0, column, str(header_text).replace("\n", ""))
+        verdict_column = len(self.result_table.headings) - 2
+        for row_index, (value, verdict) in enumerate(zip(values, verdicts), start=1):
+            self.result_table.update_cell(row_index, column, value)
+            self.result_table.update_cell(row_index, verdict_column, verdict)
+
+
+class Performance(tk.Frame):
+    def __init__(self, config_path, master=None):
+        if master is None:  # 不在参数默认值中创建Tk，导入模块时不会建窗口
+            master = tk.Tk()
+        super().__init__(master)
         self.root = master
         self.exit_button = None
-        self.tree_view = None
         self.clear_text_button = None
-        self.entry_box = None
+        self.notebook = None
+        self.station_tabs = []
         self.background = "#8FBC8F"
         self.font = "微软雅黑"
-        self.clear_button = None
-        self.execute_button = None
         self.start_height = None
         self.start_width = None
         self.box_width = None
         self.filepath = None
-        self.text_box = None
-        self.adapter_object = UPS3072Adapter('./conf/UPS3072Adapter.conf')
+        self.adapter_config = None
+        self.station_list = None
+        self.max_workers = None
+        self.report_format = None
+        self.log_max_lines = None
+        self.log_poll_ms = None
+        self.log_level = None
+        self.queue_dispatcher = None
+        self.chart_buckets = None
+        self.chart_redraw_ms = None
+        self.metrics_file = None
+        self.metrics_interval = None
+        self.metrics_port = None
+        self.history_db = None
+        self.db = None
+        # 启动耗时预算(毫秒)，窗口显示超过预算时记录警告
+        self.startup_budget_ms = None
+        self.loading_label = None
+        self.load_thread = None
+        self.load_error = None
+        self.manager = None
         self.config_path = config_path
         self.init_conf()
+        self.start_metrics()
+        self.db = ResultsDatabase(self.history_db)
         self.run()
 
     def init_conf(self):
@@ -57,6 +263,21 @@ class Performance(tk.Frame):
             self.start_height = config.getint('performance_testing', 'height')
             self.box_width = config.getint('performance_testing', 'box_width')
             self.filepath = config.get('performance_testing', 'filepath')
+            self.adapter_config = config.get('performance_testing', 'adapter_config',
+                                             fallback='./conf/UPS3072Adapter.conf')
+            self.station_list = eval(config.get('performance_testing', 'stations', fallback='["UPS3072Adapter"]'))
+            self.max_workers = config.getint('performance_testing', 'max_workers', fallback=4)
+            self.report_format = config.get('performance_testing', 'report_format', fallback='xlsx')
+            self.log_max_lines = config.getint('performance_testing', 'log_max_lines', fallback=2000)
+            self.log_poll_ms = config.getint('performance_testing', 'log_poll_ms', fallback=200)
+            self.log_level = config.get('performance_testing', 'log_level', fallback='INFO')
+            self.chart_buckets = config.getint('performance_testing', 'chart_buckets', fallback=600)
+            self.chart_redraw_ms = config.getint('performance_testing', 'chart_redraw_ms', fallback=1000)
+            self.metrics_file = config.get('performance_testing', 'metrics_file', fallback='')
+            self.metrics_interval = config.getint('performance_testing', 'metrics_interval', fallback=10)
+            self.metrics_port = config.getint('performance_testing', 'metrics_port', fallback=0)
+            self.history_db = config.get('performance_testing', 'history_db', fallback='./history/results.db')
+            self.startup_budget_ms = config.getint('performance_testing', 'startup_budget_ms', fallback=1500)
         except Exception as e:
             error_msg = f'init config file error：{e}'
             logger.error(error_msg)
@@ -66,10 +287,13 @@ class Performance(tk.Frame):
         """界面初始化"""
         self.root.title("Performance testing")
         self.root.geometry(f"{self.start_width}x{self.start_height}+100+50")
+        # 点窗口关闭按钮与“退出程序”一样：停止测试、关闭串口和数据库后再销毁窗口
+        self.root.protocol("WM_DELETE_WINDOW", self.exit)
         # Create the menu
         menu_bar = tk.Menu(self.root)
         # Create the file menu
         file_menu = tk.Menu(menu_bar, tearoff=0)
+        file_menu.add_command(label="历史记录", command=self.history)
         file_menu.add_command(label="退出", command=self.exit)
 
         # Create the help menu
@@ -82,150 +306,107 @@ class Performance(tk.Frame):
 
         # Add the menu bar to the window
         self.root.config(menu=menu_bar)
-        # 第一行
-        label = tk.Label(self.root, text="SN:", font=(self.font, 12))
-
-        self.entry_box = tk.Entry(self.root, width=self.box_width, highlightcolor='red', highlightthickness=1)
-        self.execute_button = tk.Button(self.root, text="执行测试", command=self.execute, width=10,
-                                        background=self.background, font=(self.font, 12))
-        self.execute_button.bind('<Return>', lambda event=None: self.execute_button.invoke())
-        self.clear_button = tk.Button(self.root, text="清空", command=self.clear_input, width=10,
-                                      font=(self.font, 12), background=self.background)
-
-        label.grid(row=0, column=0, padx=5, pady=5, sticky="w")
-        self.entry_box.grid(row=0, column=1, padx=5, pady=5, sticky="w")
-        self.execute_button.grid(row=0, column=2, padx=5, pady=5)
-        self.clear_button.grid(row=0, column=3, padx=5, pady=5)
+        style = ttk.Style(self.root)
+        style.configure('Treeview.Heading', font=('Helvetica', 12, 'bold'))
+        # 第一行：每个工位一个页签
+        self.notebook = ttk.Notebook(self.root)
+        self.queue_dispatcher = QueueDispatcher(self.root, self.log_poll_ms)
+        self.loading_label = tk.Label(self.notebook, text="正在加载工位...", font=(self.font, 12))
+        self.notebook.add(self.loading_label, text="加载中")
+        self.notebook.grid(row=0, column=0, columnspan=4, padx=5, pady=5, sticky="nwse")
         # 第二行
-        result_label = tk.Label(self.root, text="测试结果", font=(self.font, 12))
-        result_label.grid(row=1, column=0, padx=5, pady=5)
-        # Create the result box
-        # 第三行
         self.clear_text_button = tk.Button(self.root, text="全部清空", command=self.clear_text, width=10,
                                            background=self.background,
                                            font=(self.font, 12))
         self.exit_button = tk.Button(self.root, text="退出程序", command=self.exit, width=10,
                                      background=self.background,
                                      font=(self.font, 12))
-
-        style = ttk.Style(self.root)
-        style.configure('Treeview.Heading', font=('Helvetica', 12, 'bold'))
-        columns_list = ["序号", "测试项目", "方法", "3.2", "3.3", "3.4", "结果判断", "描述"]
-        self.tree_view = ttk.Treeview(self.root, columns=columns_list, height=20,
-                                      show="headings")
-        self.tree_view.grid(row=2, column=1, columnspan=3, padx=5, pady=5, sticky="w")  #
-        # 设置样式
-        self.tree_view.configure(style='Treeview')
-        self.clear_text_button.grid(row=3, column=2, padx=5, pady=5)
-        self.exit_button.grid(row=3, column=3, padx=5, pady=5)
-        # 第四行
-        self.log_text = tk.Text(self.root,height=10)
-        self.log_text.grid(row=4, column=1, columnspan=3, padx=5, pady=5,sticky="nwse")
+        self.clear_text_button.grid(row=1, column=2, padx=5, pady=5)
+        self.exit_button.grid(row=1, column=3, padx=5, pady=5)
+        # 窗口先显示，再在后台加载工位
+        self.root.update_idletasks()
+        self.record_startup("window")
+        self.load_thread = threading.Thread(target=self.load_stations, name="load-stations", daemon=True)
+        self.load_thread.start()
+        self.root.after(50, self.check_loaded)
         # Start the main loop
         self.root.mainloop()
 
-    def clear_input(self):
-        """清空输入框"""
-        self.entry_box.delete(0, "end")
-        logger.info("清空输入框")
-
-    def clear_text(self):
-        """全部清空"""
-        self.entry_box.delete(0, "end")
-        self.log_text.delete('1.0',"end")
-        for column in self.tree_view["columns"]:
-            self.tree_view.heading(column, text="")
-        self.tree_view.delete(*self.tree_view.get_children())
-        logger.info("全部清空")
+    def load_stations(self):
+        """后台线程：导入串口/Modbus相关模块，按配置创建各工位适配器"""
+        try:
+            from station_manager import StationManager
+            self.manager = StationManager(self.adapter_config, self.station_list, self.max_workers, self.db)
+        except Exception as e:
+            self.load_error = e
+            logger.error(f"加载工位出错:{e}")
 
-    def get_log(self):
-        """获取日志信息"""
-        q = self.adapter_object.log_q
-        while True:
-            if not q.empty():
-                log_msg = q.get()
-                date_info = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                self.log_text.insert(1.0, f"{date_info} {log_msg}" + "\r\n")
-            else:
-                pass
-            time.sleep(1)
+    def check_loaded(self):
+        """在Tk主线程等待工位加载完成后创建页签"""
+        if self.load_thread.is_alive():
+            self.root.after(50, self.check_loaded)
+            return
+        if self.manager is None:
+            self.loading_label['text'] = f"加载工位出错:{self.load_error}"
+            return
+        self.notebook.forget(self.loading_label)
+        self.loading_label.destroy()
+        for name, adapter_object in self.manager.stations.items():
+            tab = StationTab(self.notebook, name, adapter_object, self)
+            self.notebook.add(tab, text=f"{name}({adapter_object.port})")
+            self.station_tabs.append(tab)
+            self.queue_dispatcher.register(adapter_object.log_q, tab.log_text.append)
+            self.queue_dispatcher.register(adapter_object.result_q, tab.on_result_events)
+        self.queue_dispatcher.start()
+        self.record_startup("stations")
 
-    def execute(self):
-        """执行测试"""
-        self.execute_button['state'] = 'disable'
-        sn_text = self.entry_box.get().strip()  # 获取输入框中的文本，去掉两侧的换行符
-        logger.info(f"设备:{sn_text},开始测试")
-        th = threading.Thread(target=self.thread_execute, args=(sn_text,), daemon=True)
-        th.start()
-        get_log_th = threading.Thread(target=self.get_log, daemon=True)
-        get_log_th.start()
-
-    def thread_execute(self, sn_text):
-        """线程执行测试"""
-        time_str = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        time_file_str = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
-        filename = f"SN_{sn_text}_{time_file_str}.xlsx"
-        log_msg = ""
-        is_ok = False
-        if not os.path.exists(self.filepath):
-            log_msg = f"找不到文件路径：{self.filepath}"
+    def record_startup(self, phase):
+        """记录启动各阶段耗时，window：窗口显示；stations：工位可用"""
+        elapsed = time.perf_counter() - START_TIME
+        STARTUP_SECONDS.observe(elapsed, phase=phase)
+        log_msg = f"启动耗时({phase}):{elapsed * 1000:.0f}ms"
+        if phase == "window" and elapsed * 1000 > self.startup_budget_ms:
+            logger.warning(f"{log_msg},超过预算{self.startup_budget_ms}ms")
         else:
-            abs_filepath = os.path.join(self.filepath, filename)
-            # abs_filepath = os.path.join(r"C:\Users\lyh\Desktop\工作文件\UPS3702\测试报告",
-            #                             "data.xlsx")
-            try:
-                self.adapter_object.connect()
-                is_ok, log_msg = self.adapter_object.read_hold_register(abs_filepath, time_str, sn_text)
-                # is_ok = True
-            except Exception as e:
-                log_msg = f"执行测试出错:{e}"
-                logger.info(log_msg)
+            logger.info(log_msg)
 
-            else:
-                if is_ok:  # 测试成功
-                    # 读取xlsx文件内容
-                    rows = []
-                    if os.path.exists(abs_filepath):
-                        try:
-                            workbook = openpyxl.load_workbook(abs_filepath)
-                            worksheet = workbook.active
-                        except Exception as e:
-                            log_msg = f"打开测试报告出错:{e}"
-                        else:
-                            if worksheet.max_row <= 2 or worksheet.max_column <= 4:
-                                log_msg = f"测试报告内容为空"
-                            else:
-                                for row in worksheet.iter_rows(values_only=True):
-                                    rows.append(row)
-                                # 设置列名
-                                self.tree_view['columns'] = tuple(rows[1])
-                                self.treeview_scrollbar = ttk.Scrollbar(self.root, orient='vertical',
-                                                                        command=self.tree_view.yview)
-                                self.treeview_scrollbar.grid(row=2, column=4, sticky=(tk.N, tk.S))
-                                self.tree_view.configure(yscrollcommand=self.treeview_scrollbar.set)
-
-                                # 设置 heading
-                                for i, column in enumerate(rows[0]):
-                                    self.tree_view.heading(i, text=column)
-                                for row_index, row in enumerate(rows[1:]):
-                                    if row_index == 0:
-                                        table_head_list = list(row)
-                                        table_head_list = [item.replace("\n", "") for item in table_head_list]
-                                        row = tuple(table_head_list)
-                                        self.tree_view.insert("", tk.END, values=row)
-                                    else:
-                                        self.tree_view.insert("", tk.END, values=row)
-                                log_msg = f"测试完成！"
-                    else:
-                        log_msg = f"找不到报告：{abs_filepath}"
+    def start_metrics(self):
+        """按配置输出运行指标文件/HTTP端口"""
+        try:
+            if self.metrics_file:
+                REGISTRY.start_textfile_writer(self.metrics_file, self.metrics_interval)
+            if self.metrics_port:
+                REGISTRY.start_http_server(self.metrics_port)
+        except Exception as e:
+            logger.error(f"启动指标输出出错:{e}")
 
-        logger.info(log_msg)
-        msgbox.showinfo(title="提示", message=log_msg)
-        self.execute_button['state'] = 'normal'
+    def clear_text(self):
+        """全部清空"""
+        for tab in self.station_tabs:
+            tab.clear_text()
+        logger.info("全部清空")
+
+    def history(self):
+        """打开历史记录查询窗口"""
+        from history_view import HistoryWindow
+        HistoryWindow(self.root, self.db, self.font, self.report_format)
 
     def exit(self):
         """退出"""
-        self.root.destroy()
+        try:
+            self.queue_dispatcher.stop()
+            if self.manager is not None:
+                # 停止测试并等待测试线程退出，再关闭串口，避免收发到一半时关闭
+                self.manager.cancel_all()
+        finally:
+            # 线程池的工作线程不是守护线程，任何情况下都要撤销排队任务并关闭，否则程序无法退出
+            if self.manager is not None:
+                self.manager.shutdown()
+                from connection_pool import POOL
+                POOL.close_all()
+            self.db.close()
+            REGISTRY.stop()
+            self.root.destroy()
         # sys.exit(0)# 终止线程
         logger.info(f"退出")
 
@@ -0,0 +1,80 @@
+# -- coding: utf-8 --
+# @info:
+# @Author : liyahui
+# @Time : 2023/6/14 上午9:45
+# @File : register_planner.py
+# @Software: PyCharm
+
+"""寄存器读取规划：等待节点时只读触发寄存器，到达节点时按Modbus单次读取上限合并成连续块一次性读取"""
+
+# 03H单次最多读取125个保持寄存器
+MAX_READ_REGISTERS = 125
+# RTU帧字节数：请求 地址1+功能码1+起始地址2+数量2+CRC2；响应 地址1+功能码1+字节数1+数据2n+CRC2
+REQUEST_BYTES = 8
+RESPONSE_BYTES = 5
+
+
+class ReadPlanner(object):
+    def __init__(self, addr_mapping, start_addr, trigger_indexes=(35,), poll_mode='minimal',
+                 max_read_registers=MAX_READ_REGISTERS, extra_indexes=()):
+        """
+        :param addr_mapping: 寄存器地址映射，key为寄存器地址
+        :param start_addr: 数据帧第0个元素对应的寄存器地址
+        :param trigger_indexes: 等待阶段需要读取的数据帧下标
+        :param poll_mode: minimal：等待阶段只读触发寄存器；full：每次都读取全部寄存器
+        :param max_read_registers: 单次读取寄存器上限
+        :param extra_indexes: minimal模式下等待阶段同时读取的数据帧下标，如实时曲线的总电压
+        """
+        self.start_addr = start_addr
+        self.poll_mode = poll_mode
+        self.max_read_registers = min(max_read_registers, MAX_READ_REGISTERS)
+        self.addresses = sorted(int(key) for key in addr_mapping.keys())
+        self.length = self.addresses[-1] - start_addr + 1 if self.addresses else 0
+        self.capture_plan = self.coalesce(self.addresses)
+        if poll_mode == 'full':
+            self.trigger_plan = self.capture_plan
+        else:
+            indexes = list(trigger_indexes) + list(extra_indexes)
+            self.trigger_plan = self.coalesce([start_addr + index for index in indexes])
+        self.transactions = 0
+        self.bytes = 0
+
+    def coalesce(self, addresses):
+        """把寄存器地址合并为[(起始地址, 数量)]的连续块，每块不超过单次读取上限"""
+        plan = []
+        for address in sorted(set(addresses)):
+            if plan and plan[-1][0] + plan[-1][1] == address and plan[-1][1] < self.max_read_registers:
+                plan[-1] = (plan[-1][0], plan[-1][1] + 1)
+            else:
+                plan.append((address, 1))
+        return plan
+
+    def read(self, plan, read_fn):
+        """
+        按规划读取寄存器
+        :param plan: [(起始地址, 数量)]
+        :param read_fn: read_fn(起始地址, 数量)返回寄存器值序列
+        :return: 长度为self.length的数据帧，未读取的位置为None
+        """
+        frame = [None] * self.length
+        for address, quantity in plan:
+            values = read_fn(address, quantity)
+            self.transactions += 1
+            self.bytes += REQUEST_BYTES + RESPONSE_BYTES + 2 * quantity
+            offset = address - self.start_addr
+            frame[offset:offset + quantity] = list(values)
+        return frame
+
+    def poll(self, read_fn):
+        """等待阶段轮询"""
+        return self.read(self.trigger_plan, read_fn)
+
+    def capture(self, read_fn, frame=None):
+        """到达节点时读取全部寄存器，full模式下直接复用轮询帧"""
+        if self.poll_mode == 'full' and frame is not None:
+            return frame
+        return self.read(self.capture_plan, read_fn)
+
+    def stats(self):
+        """return: (事务数, 字节数)"""
+        return self.transactions, self.bytes
@@ -0,0 +1,141 @@
+# -- coding: utf-8 --
+# @info:
+# @Author : liyahui
+# @Time : 2023/6/16 下午3:30
+# @File : report_writer.py
+# @Software: PyCharm
+
+"""测试报告输出：xlsx(只写流式模式+命名样式)、csv、jsonl、parquet，按performance_testing.conf中report_format选择"""
+import csv
+import json
+
+# 报告列宽
+COLUMN_WIDTHS = {"A": 10, "B": 30, "C": 20, "D": 30, "E": 30, "F": 30, "G": 20, "H": 100}
+
+
+def display_header(table_head):
+    """去掉表头中的换行"""
+    return [str(item).replace("\n", "") for item in table_head]
+
+
+class ReportWriter(object):
+    """报告输出基类"""
+    extension = ""
+
+    def write(self, table_head, data_list, file_path, time_str, sn=None):
+        """
+        写入报告
+        :param table_head: 表头
+        :param data_list: 数据行
+        :param file_path: 报告文件路径
+        :param time_str: 测试时间字符串
+        :param sn: 被测设备唯一标识符
+        """
+        raise NotImplementedError
+
+
+class XlsxReportWriter(ReportWriter):
+    """xlsx报告，只写模式逐行写出，样式使用命名样式共享，不再逐单元格创建样式对象"""
+    extension = ".xlsx"
+
+    @staticmethod
+    def add_styles(wb):
+        """注册报告用到的命名样式"""
+        from openpyxl.styles import Alignment, Font, PatternFill, Border, colors, Side, NamedStyle
+        fill = PatternFill(patternType="solid", fgColor="99CCFF", bgColor="99CCFF")
+        thin = Side(border_style="thin", color=colors.BLACK)
+        medium = Side(border_style="medium", color=colors.BLACK)
+        table_border = Border(top=medium, bottom=medium, left=medium, right=medium)
+        title = NamedStyle(name="report_title", font=Font(name="微软雅黑", size=16, bold=True),
+                           fill=fill, border=table_border)
+        head = NamedStyle(name="report_head", font=Font(name="微软雅黑", size=16, bold=True),
+                          fill=fill, border=table_border, alignment=Alignment(wrapText=True))
+        cell = NamedStyle(name="report_cell", font=Font(name="微软雅黑", size=13),
+                          border=Border(top=thin, bottom=thin, left=thin, right=thin))
+        for style in (title, head, cell):
+            wb.add_named_style(style)
+
+    def write(self, table_head, data_list, file_path, time_str, sn=None):
+        import openpyxl
+        from openpyxl.cell import WriteOnlyCell
+        wb = openpyxl.Workbook(write_only=True)
+        self.add_styles(wb)
+        sheet = wb.create_sheet()
+        for column, width in COLUMN_WIDTHS.items():
+            sheet.column_dimensions[column].width = width
+
+        def styled_row(values, style):
+            row = []
+            for value in values:
+                cell = WriteOnlyCell(sheet, value=value)
+                cell.style = style
+                row.append(cell)
+            return row
+
+        title_values = ["SN:", sn, "测试日期:", time_str]
+        title_values += [None] * (len(table_head) - len(title_values))
+        sheet.append(styled_row(title_values, "report_title"))
+        sheet.append(styled_row(table_head, "report_head"))
+        for data_item in data_list:
+            sheet.append(styled_row(data_item, "report_cell"))
+        wb.save(file_path)
+
+
+class CsvReportWriter(ReportWriter):
+    """csv报告，带BOM以便Excel直接打开"""
+    extension = ".csv"
+
+    def write(self, table_head, data_list, file_path, time_str, sn=None):
+        with open(file_path, "w", newline="", encoding="utf-8-sig") as f:
+            writer = csv.writer(f)
+            writer.writerow(["SN:", sn, "测试日期:", time_str])
+            writer.writerow(display_header(table_head))
+            writer.writerows(data_list)
+
+
+class JsonLinesReportWriter(ReportWriter):
+    """jsonl报告，首行为测试信息，其后每行一个数据行"""
+    extension = ".jsonl"
+
+    def write(self, table_head, data_list, file_path, time_str, sn=None):
+        header = display_header(table_head)
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"sn": sn, "time": time_str, "header": header}, ensure_ascii=False) + "\n")
+            for data_item in data_list:
+                f.write(json.dumps(dict(zip(header, data_item)), ensure_ascii=False) + "\n")
+
+
+class ParquetReportWriter(ReportWriter):
+    """parquet列式报告，便于批量分析，需要安装pyarrow"""
+    extension = ".parquet"
+
+    def write(self, table_head, data_list, file_path, time_str, sn=None):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("parquet格式需要安装pyarrow")
+        header = display_header(table_head)
+        columns = {"SN": [sn] * len(data_list), "测试日期": [time_str] * len(data_list)}
+        for col_index, name in enumerate(header):
+            values = [row[col_index] if col_index < len(row) else None for row in data_list]
+            if all(isinstance(value, (int, float)) for value in values):  # 数值列保持数值类型
+                columns[name] = [float(value) for value in values]
+            else:
+                columns[name] = [None if value is None else str(value) for value in values]
+        pq.write_table(pa.table(columns), file_path)
+
+
+REPORT_WRITERS = {
+    "xlsx": XlsxReportWriter,
+    "csv": CsvReportWriter,
+    "jsonl": JsonLinesReportWriter,
+    "parquet": ParquetReportWriter,
+}
+
+
+def get_report_writer(report_format="xlsx"):
+    """按格式名称返回报告输出对象"""
+    if report_format not in REPORT_WRITERS:
+        raise ValueError(f"不支持的报告格式:{report_format}，可选:{','.join(REPORT_WRITERS)}")
+    return REPORT_WRITERS[report_format]()
@@ -0,0 +1,76 @@
+# -- coding: utf-8 --
+# @info:
+# @Author : liyahui
+# @Time : 2023/6/15 上午10:05
+# @File : result_model.py
+# @Software: PyCharm
+
+"""测试结果对象：表头、数据行、各节点采集数据及判断结果，界面和报告都从这里取数据"""
+import datetime
+
+PASS = "合格"
+FAIL = "不合格"
+
+
+def merge_verdict(current, verdict):
+    """合并各节点的判断结果：任一节点不合格即为不合格，之后节点的合格不覆盖"""
+    if current == FAIL or not verdict:
+        return current
+    return verdict
+
+
+class NodeCapture(object):
+    """单个节点的采集数据"""
+
+    def __init__(self, node_index, node_value, real_value, frame, capture_time=None):
+        self.node_index = node_index
+        self.node_value = node_value
+        self.real_value = real_value
+        # 原始寄存器数据帧
+        self.frame = list(frame)
+        self.capture_time = capture_time or datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        # 该节点各数据行的判断结果，不参与判断的行为""
+        self.verdicts = []
+
+
+class TestResult(object):
+    def __init__(self, sn, time_str, header, rows):
+        """
+        :param sn: 被测设备唯一标识符
+        :param time_str: 测试时间字符串
+        :param header: 表头，如["序号","测试项目","方法","节点1","节点2","节点3","结果判断","描述"]
+        :param rows: 数据行，列与表头一一对应
+        """
+        self.sn = sn
+        self.time_str = time_str
+        self.header = header
+        self.rows = rows
+        self.captures = []
+        self.is_ok = False
+        # 测试被停止，已采集的节点为部分结果
+        self.cancelled = False
+        self.message = ""
+        self.report_path = None
+        # 轮询数据记录文件，未开启记录时为None
+        self.frames_path = None
+        # 各阶段耗时(秒)：connect、modbus、wait_node_N、decode、report
+        self.timings = {}
+
+    def add_capture(self, capture):
+        """记录节点采集数据"""
+        self.captures.append(capture)
+
+    def verdicts(self):
+        """return: 各数据行最终判断结果"""
+        return [row[-2] for row in self.rows]
+
+    def is_pass(self):
+        """
+        测试完成且已采集节点、所有节点都没有不合格项，与历史库合格率、重新判断的规则一致；
+        连接失败、等待超时、中途出错的测试不算合格
+        """
+        return self.is_ok and bool(self.captures) and not any(FAIL in capture.verdicts for capture in self.captures)
+
+    def display_header(self):
+        """界面显示用表头，去掉换行"""
+        return [str(item).replace("\n", "") for item in self.header]
@@ -0,0 +1,241 @@
+# -- coding: utf-8 --
+# @info:
+# @Author : liyahui
+# @Time : 2023/7/12 下午2:15
+# @File : results_db.py
+# @Software: PyCharm
+
+"""测试结果历史库：每次测试的表格、节点采集和判断结果批量写入本地SQLite，按SN、日期、节点、寄存器建索引"""
+import json
+import os
+import sqlite3
+import threading
+
+from LogFormat import LogFormat
+from result_model import TestResult, PASS, FAIL
+
+log = LogFormat('results_db', "results_db.log")
+logger = log.logger
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sn TEXT NOT NULL,
+    station TEXT,
+    test_time TEXT NOT NULL,
+    is_ok INTEGER,
+    is_pass INTEGER,
+    cancelled INTEGER DEFAULT 0,
+    message TEXT,
+    header TEXT,
+    rows TEXT,
+    report_path TEXT,
+    frames_path TEXT,
+    timings TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_runs_sn ON runs (sn, test_time);
+CREATE INDEX IF NOT EXISTS idx_runs_time ON runs (test_time);
+CREATE TABLE IF NOT EXISTS captures (
+    run_id INTEGER NOT NULL,
+    node_index INTEGER NOT NULL,
+    node_value REAL,
+    real_value REAL,
+    capture_time TEXT,
+    frame TEXT,
+    PRIMARY KEY (run_id, node_index)
+);
+CREATE TABLE IF NOT EXISTS measurements (
+    run_id INTEGER NOT NULL,
+    node_index INTEGER NOT NULL,
+    register INTEGER NOT NULL,
+    item TEXT,
+    value REAL,
+    verdict TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_measurements_run ON measurements (run_id, node_index);
+CREATE INDEX IF NOT EXISTS idx_measurements_register ON measurements (register, node_index);
+"""
+# 历史库版本，保存在PRAGMA user_version
+SCHEMA_VERSION = 1
+
+
+def verdict_text(is_ok, is_pass, cancelled=False):
+    """测试记录的结果文字，停止或未完成的测试不论判断项如何都不算合格"""
+    if cancelled:
+        return "已停止"
+    if not is_ok:
+        return "未完成"
+    return PASS if is_pass else FAIL
+
+
+class ResultsDatabase(object):
+    def __init__(self, db_path):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # 多个工位线程共用一个连接，写入时加锁
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript(SCHEMA)
+            self.migrate()
+
+    def migrate(self):
+        """旧版本历史库补充新增的列、修正旧数据，调用方需持有锁"""
+        columns = [row["name"] for row in self.conn.execute("PRAGMA table_info(captures)")]
+        if "frame" not in columns:  # 原始数据帧，用于按新规则重新判断
+            self.conn.execute("ALTER TABLE captures ADD COLUMN frame TEXT")
+        columns = [row["name"] for row in self.conn.execute("PRAGMA table_info(runs)")]
+        if "cancelled" not in columns:  # 测试被停止，已采集的节点为部分结果
+            self.conn.execute("ALTER TABLE runs ADD COLUMN cancelled INTEGER DEFAULT 0")
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < 1:  # 旧版本把未完成的测试也记为合格
+            with self.conn:
+                self.conn.execute("UPDATE runs SET is_pass = 0 WHERE is_ok = 0 AND is_pass = 1")
+        self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def save_result(self, result, station=None, start_addr=0):
+        """
+        保存一次测试，单个事务批量写入
+        :param result: TestResult
+        :param start_addr: 数据行第0行对应的寄存器地址
+        :return: run_id
+        """
+        captures = []
+        measurements = []
+        for capture in result.captures:
+            captures.append((capture.node_index, capture.node_value, capture.real_value, capture.capture_time,
+                             json.dumps(capture.frame)))
+            column = 3 + capture.node_index
+            for row_index, row in enumerate(result.rows):
+                value = row[column] if column < len(row) else None
+                verdict = capture.verdicts[row_index] if row_index < len(capture.verdicts) else ""
+                measurements.append((capture.node_index, start_addr + row_index, row[1],
+                                     value if isinstance(value, (int, float)) else None, verdict))
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO runs (sn, station, test_time, is_ok, is_pass, cancelled, message, header, rows, "
+                "report_path, frames_path, timings) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (result.sn or "", station, result.time_str, int(result.is_ok), int(result.is_pass()),
+                 int(result.cancelled), result.message, json.dumps(result.header, ensure_ascii=False),
+                 json.dumps(result.rows, ensure_ascii=False),
+                 result.report_path, result.frames_path, json.dumps(result.timings)))
+            run_id = cursor.lastrowid
+            self.conn.executemany("INSERT INTO captures VALUES (?, ?, ?, ?, ?, ?)",
+                                  [(run_id,) + item for item in captures])
+            self.conn.executemany("INSERT INTO measurements VALUES (?, ?, ?, ?, ?, ?)",
+                                  [(run_id,) + item for item in measurements])
+        logger.info(f"保存测试记录:{result.sn},run_id={run_id},{len(measurements)}条测量值")
+        return run_id
+
+    def search(self, sn=None, date_from=None, date_to=None, limit=5000):
+        """
+        按SN前缀和日期范围查询
+        :param date_from: 起始日期 YYYY-MM-DD
+        :param date_to: 截止日期 YYYY-MM-DD(含当天)
+        :return: [sqlite3.Row]，按测试时间倒序
+        """
+        conditions = []
+        params = []
+        if sn:  # 前缀匹配，用范围条件走索引
+            conditions.append("sn >= ? AND sn < ?")
+            params += [sn, sn + "\uffff"]
+        if date_from:
+            conditions.append("test_time >= ?")
+            params.append(date_from)
+        if date_to:
+            conditions.append("test_time <= ?")
+            params.append(date_to + " 23:59:59")
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        sql = (f"SELECT id, sn, station, test_time, is_ok, is_pass, cancelled, message, report_path FROM runs "
+               f"{where} ORDER BY test_time DESC LIMIT ?")
+        with self.lock:
+            return self.conn.execute(sql, params + [limit]).fetchall()
+
+    def load_result(self, run_id):
+        """读取一次测试为TestResult，用于重新导出报告"""
+        with self.lock:
+            run = self.conn.execute("SELECT * FROM runs WHERE id = ?", (run_id,)).fetchone()
+        if run is None:
+            return None
+        result = TestResult(run["sn"], run["test_time"], json.loads(run["header"]), json.loads(run["rows"]))
+        result.is_ok = bool(run["is_ok"])
+        result.cancelled = bool(run["cancelled"])
+        result.message = run["message"]
+        result.report_path = run["report_path"]
+        result.frames_path = run["frames_path"]
+        result.timings = json.loads(run["timings"] or "{}")
+        return result
+
+    def _select_lot(self, run_ids):
+        """选中的run_id写入临时表，避免IN条件超过SQLite参数个数上限；调用方需持有锁"""
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS lot (run_id INTEGER PRIMARY KEY)")
+        self.conn.execute("DELETE FROM lot")
+        self.conn.executemany("INSERT OR IGNORE INTO lot VALUES (?)", [(run_id,) for run_id in run_ids])
+
+    def _query_lot(self, run_ids, sql, params=()):
+        with self.lock, self.conn:
+            self._select_lot(run_ids)
+            return [tuple(row) for row in self.conn.execute(sql, params).fetchall()]
+
+    def compare(self, run_ids):
+        """
+        多次测试对比：按寄存器、节点排列各次测试的测量值
+        :return: [(run_id, sn, test_time, node_value, register, item, value, verdict)]
+        """
+        return self._query_lot(
+            run_ids,
+            "SELECT m.run_id, r.sn, r.test_time, c.node_value, m.register, m.item, m.value, m.verdict "
+            "FROM lot JOIN measurements m ON m.run_id = lot.run_id JOIN runs r ON r.id = m.run_id "
+            "LEFT JOIN captures c ON c.run_id = m.run_id AND c.node_index = m.node_index "
+            "ORDER BY m.register, m.node_index, r.test_time")
+
+    def lot_runs(self, run_ids):
+        """return: [(run_id, sn, station, test_time, is_ok, is_pass, cancelled)]，按测试时间排列"""
+        return self._query_lot(
+            run_ids,
+            "SELECT r.id, r.sn, r.station, r.test_time, r.is_ok, r.is_pass, r.cancelled FROM lot "
+            "JOIN runs r ON r.id = lot.run_id ORDER BY r.test_time")
+
+    def pass_rates(self, run_ids):
+        """
+        各寄存器合格率，按台统计：同一台设备任一节点不合格该寄存器即不合格，与TestResult.is_pass规则一致；
+        只统计参与判断的测量值
+        :return: [(register, item, 判断台数, 合格台数)]
+        """
+        return self._query_lot(
+            run_ids,
+            "SELECT register, item, COUNT(*), SUM(passed) FROM ("
+            "SELECT m.register, m.item, MAX(m.verdict = ?) = 0 AS passed FROM lot JOIN measurements m "
+            "ON m.run_id = lot.run_id WHERE m.verdict != '' GROUP BY m.run_id, m.register, m.item) "
+            "GROUP BY register, item ORDER BY register",
+            (FAIL,))
+
+    def node_values(self, run_ids):
+        """
+        各节点各寄存器的测量值，用于统计分布
+        :return: [(node_index, node_value, register, item, value)]，按节点、寄存器排列
+        """
+        return self._query_lot(
+            run_ids,
+            "SELECT m.node_index, c.node_value, m.register, m.item, m.value FROM lot JOIN measurements m "
+            "ON m.run_id = lot.run_id LEFT JOIN captures c ON c.run_id = m.run_id AND c.node_index = m.node_index "
+            "WHERE m.value IS NOT NULL ORDER BY m.node_index, m.register")
+
+    def capture_frames(self, run_ids):
+        """return: [(run_id, node_index, 原始数据帧json)]"""
+        return self._query_lot(
+            run_ids,
+            "SELECT c.run_id, c.node_index, c.frame FROM lot JOIN captures c ON c.run_id = lot.run_id "
+            "ORDER BY c.run_id, c.node_index")
+
+    def update_report_path(self, run_id, report_path):
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE runs SET report_path = ? WHERE id = ?", (report_path, run_id))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,145 @@
+# -- coding: utf-8 --
+# @info:
+# @Author : liyahui
+# @Time : 2023/6/12 上午9:20
+# @File : station_manager.py
+# @Software: PyCharm
+
+"""多工位管理：每个工位对应一个UPS3072Adapter(串口+从站地址，同一串口上的多个从站共用一条总线)，通过有界线程池并发执行测试"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+
+from LogFormat import LogFormat
+from UPS3072Adapter import UPS3072Adapter
+from cancellation import CancelToken
+
+log = LogFormat('station_manager', "station_manager.log")
+logger = log.logger
+
+
+class StationManager(object):
+    def __init__(self, config_path, station_list, max_workers=4, db=None):
+        """
+        :param config_path: UPS3072Adapter配置文件路径
+        :param station_list: 工位配置段名称列表，如["UPS3072Adapter", "UPS3072Adapter.station2"]
+        :param max_workers: 同时执行测试的最大工位数
+        :param db: 测试结果历史库ResultsDatabase，为None时不保存
+        """
+        self.config_path = config_path
+        self.db = db
+        self.station_list = station_list
+        self.max_workers = max_workers
+        self.stations = OrderedDict()
+        self.futures = {}
+        # 各工位当前测试的取消标志
+        self.tokens = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='station')
+        # 报告生成放到后台，不阻塞结果显示和完成提示
+        self.report_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='report')
+        self.init_stations()
+
+    def init_stations(self):
+        """按配置段创建各工位适配器，配置了slaves的配置段每个从站地址一个工位，共用该串口的连接"""
+        for section in self.station_list:
+            adapter = UPS3072Adapter(self.config_path, section)
+            adapters = [UPS3072Adapter(self.config_path, section, addr) for addr in adapter.slaves] or [adapter]
+            for adapter in adapters:
+                self.stations[adapter.name] = adapter
+                logger.info(f"加载工位:{adapter.name},串口{adapter.port},从站{adapter.addr}")
+
+    def get_adapter(self, name):
+        """return: 工位对应的适配器"""
+        return self.stations[name]
+
+    def is_busy(self, name):
+        """工位是否正在测试(含排队等待线程池)"""
+        with self.lock:
+            future = self.futures.get(name)
+            return future is not None and not future.done()
+
+    def submit(self, name, fn, *args):
+        """
+        提交工位测试任务，线程池满时排队等待；fn以关键字参数token接收取消标志
+        :return: (Bool,data) 成功返回future，失败返回提示信息
+        """
+        with self.lock:
+            future = self.futures.get(name)
+            if future is not None and not future.done():
+                log_msg = f"工位{name}正在测试中"
+                logger.info(log_msg)
+                return False, log_msg
+            token = CancelToken()
+            future = self.executor.submit(fn, *args, token=token)
+            self.futures[name] = future
+            self.tokens[name] = token
+        logger.info(f"工位{name}提交测试任务")
+        return True, future
+
+    def submit_report(self, name, result, file_path=None, writer=None):
+        """后台生成工位测试报告并保存到历史库，file_path为None时只保存历史，return: future"""
+        logger.info(f"工位{name}提交报告任务:{file_path}")
+        return self.report_executor.submit(self.finish_result, name, result, file_path, writer)
+
+    def finish_result(self, name, result, file_path=None, writer=None):
+        """
+        生成报告、保存历史记录
+        :return: (Bool,data) 成功/失败，成功/失败提示信息
+        """
+        adapter = self.stations[name]
+        is_ok, log_msg = True, ""
+        if file_path:
+            is_ok, log_msg = adapter.write_report(result, file_path, writer)
+        if self.db is not None:
+            try:
+                self.db.save_result(result, name, adapter.start_addr)
+            except Exception as e:
+                log_msg = f"工位{name}保存历史记录出错:{e}"
+                logger.error(log_msg)
+                return False, log_msg
+        return is_ok, log_msg
+
+    def cancel(self, name, reason="测试已停止"):
+        """
+        停止工位测试：排队中的任务直接撤销，执行中的任务在下一次检查取消标志时退出
+        :return: (Bool,str)
+        """
+        with self.lock:
+            future = self.futures.get(name)
+            token = self.tokens.get(name)
+            if future is None or future.done():
+                return False, f"工位{name}没有正在执行的测试"
+            token.cancel(reason)
+            if future.cancel():
+                log_msg = f"工位{name}排队中的测试已撤销"
+            else:
+                log_msg = f"工位{name}正在停止测试"
+        logger.info(log_msg)
+        return True, log_msg
+
+    def cancel_all(self, timeout=1.0, reason="程序退出"):
+        """停止全部工位测试并等待测试线程退出，return: 超时仍未退出的工位"""
+        with self.lock:
+            running = {name: future for name, future in self.futures.items() if not future.done()}
+        for name in running:
+            self.cancel(name, reason)
+        _, not_done = wait_futures(list(running.values()), timeout=timeout)
+        names = [name for name, future in running.items() if future in not_done]
+        if names:
+            logger.warning(f"工位{names}在{timeout}秒内未退出")
+        return names
+
+    def shutdown(self, wait=False, reason="程序退出"):
+        """
+        关闭线程池：先给所有未结束的测试置取消标志，再撤销排队中的任务，
+        工作线程不是守护线程，执行中的测试要靠取消标志退出，解释器才能正常退出；
+        已提交的报告和历史记录总是写完再返回
+        """
+        with self.lock:
+            for name, future in self.futures.items():
+                if not future.done():
+                    self.tokens[name].cancel(reason)
+        self.executor.shutdown(wait=wait, cancel_futures=True)
+        self.report_executor.shutdown(wait=True)
+        logger.info("工位线程池已关闭")
@@ -0,0 +1,61 @@
+# -- coding: utf-8 --
+# @info:
+# @Author : liyahui
+# @Time : 2023/7/21 上午10:10
+# @File : test_bus_scheduler.py
+# @Software: PyCharm
+
+"""总线调度：不依赖串口和适配器，直接验证占用统计、优先级和轮询间隔"""
+import time
+
+import pytest
+
+from bus_scheduler import BusScheduler
+
+
+def test_utilization_drops_records_outside_window():
+    bus = BusScheduler(window=10.0)
+    bus.record(1, 2.0, now=0.0)
+    bus.record(2, 3.0, now=5.0)
+
+    assert bus.utilization(now=5.0) == pytest.approx(0.5)
+    assert bus.utilization(now=12.0) == pytest.approx(0.3)  # 从站1的记录已移出窗口
+    assert bus.share(1, now=12.0) == (0.0, 1.0)
+
+
+def test_share_without_traffic_is_fair():
+    assert BusScheduler().share(1, now=0.0) == (0.0, 1.0)
+
+
+def test_near_node_polls_first():
+    bus = BusScheduler()
+
+    assert bus.priority(1, eta=1.0) < bus.priority(2, eta=30.0)
+    assert bus.priority(1, eta=None, default_eta=60.0) == bus.priority(2, eta=60.0)
+
+
+def test_heavy_slave_loses_priority():
+    bus = BusScheduler()
+    now = time.monotonic()
+    bus.record(1, 3.0, now)
+    bus.record(2, 1.0, now)
+
+    # 从站1占用3/4，平均份额1/2，优先级按1.5倍降低；从站2低于平均份额不加权
+    assert bus.priority(1, eta=9.0) == 15.0
+    assert bus.priority(2, eta=9.0) == 10.0
+
+
+def test_busy_bus_stretches_far_slaves_only():
+    bus = BusScheduler(window=10.0, target_utilization=0.5)
+    bus.record(1, 8.0, time.monotonic())
+
+    assert bus.next_interval(1.0, eta=60.0) == pytest.approx(1.6)
+    assert bus.next_interval(1.0, eta=2.0) == 1.0
+    assert bus.next_interval(1.0, eta=None) == pytest.approx(1.6)
+
+
+def test_idle_bus_keeps_interval():
+    bus = BusScheduler(window=10.0, target_utilization=0.5)
+    bus.record(1, 1.0, time.monotonic())
+
+    assert bus.next_interval(1.0, eta=60.0) == 1.0
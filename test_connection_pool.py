@@ -0,0 +1,65 @@
+# -- coding: utf-8 --
+# @info:
+# @Author : liyahui
+# @Time : 2023/7/21 上午9:30
+# @File : test_connection_pool.py
+# @Software: PyCharm
+
+"""连接池：同一串口上多个从站，其中一个从站无响应时不影响其他从站的连接"""
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("serial")
+pytest.importorskip("modbus_tk")
+pytest.importorskip("LogFormat")
+UPS3072Adapter = pytest.importorskip("UPS3072Adapter").UPS3072Adapter
+
+from connection_pool import POOL
+from ups3072_simulator import UPS3072Simulator, UnitModel, ChargeCurve
+
+
+@pytest.fixture
+def bus(tmp_path):
+    """只有从站1的模拟总线，return: (配置文件路径, 串口路径)"""
+    simulator = UPS3072Simulator({1: UnitModel(ChargeCurve())})
+    port = simulator.start()
+    conf = Path(__file__).with_name("UPS3072Adapter.conf").read_text(encoding="utf-8")
+    conf = conf.replace("port = COM1", f"port = {port}").replace("timeout = 0.5", "timeout = 0.1")
+    conf = conf.replace("retries = 3", "retries = 0")
+    file_path = tmp_path / "UPS3072Adapter.conf"
+    file_path.write_text(conf, encoding="utf-8")
+    yield str(file_path), port
+    POOL.close_all()
+    simulator.stop()
+
+
+def test_absent_slave_keeps_bus_open(bus):
+    file_path, port = bus
+    present = UPS3072Adapter(file_path, addr=1)
+    absent = UPS3072Adapter(file_path, addr=2)
+    assert present.connect()[0]
+    transport = present.transport
+
+    is_ok, msg = absent.connect()
+
+    assert not is_ok
+    assert "从站2无响应" in msg
+    assert POOL.get(port) is transport
+    assert transport.is_open()
+    assert len(present.read_registers(present.start_addr, 1)) == 1
+
+
+def test_adapter_refetches_transport_after_reconnect(bus):
+    file_path, port = bus
+    first = UPS3072Adapter(file_path, addr=1)
+    second = UPS3072Adapter(file_path, addr=1)
+    assert first.connect()[0]
+    stale = first.transport
+    POOL.close(port)  # 串口掉线后由同一串口的另一工位重连
+
+    assert second.connect()[0]
+
+    assert not stale.is_open()
+    assert len(first.read_registers(first.start_addr, 1)) == 1
+    assert first.transport is POOL.get(port)
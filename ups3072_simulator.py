@@ -0,0 +1,287 @@
+# -- coding: utf-8 --
+# @info:
+# @Author : liyahui
+# @Time : 2023/7/3 上午9:00
+# @File : ups3072_simulator.py
+# @Software: PyCharm
+
+"""UPS3072 Modbus RTU从站模拟器：通过伪终端提供addr_mapping寄存器布局，模拟充放电曲线、单体噪声、开路/超时/CRC故障，支持时间加速
+用法：python ups3072_simulator.py --accel 600，把打印出的串口路径配置到UPS3072Adapter.conf的port"""
+import argparse
+import math
+import os
+import random
+import select
+import struct
+import threading
+import time
+import tty
+
+from LogFormat import LogFormat
+
+log = LogFormat('ups3072_simulator', "ups3072_simulator.log")
+logger = log.logger
+
+CELL_COUNT = 16
+# 寄存器地址，与UPS3072Adapter.conf中addr_mapping一致
+CELL_COUNT_ADDR = 2
+CAPACITY_ADDR = 3
+BAUD_CODE_ADDR = 4
+CALIBRATED_ADDR = 5
+REAL_CAPACITY_ADDR = 6
+POWER_STATE_ADDR = 7
+AC_FREQUENCY_ADDR = 8
+AC_VOLTAGE_ADDR = 9
+CHARGE_CURRENT_ADDR = 10
+DISCHARGE_CURRENT_ADDR = 11
+INSULATION_ADDR = 15
+OPEN_VOLTAGE_ADDR = 17
+OPEN_TEMPERATURE_ADDR = 18
+TOTAL_VOLTAGE_ADDR = 36
+CELL_VOLTAGE_ADDR = 37
+TEMPERATURE_ADDR = 53
+LAST_ADDR = 68
+
+
+def crc16(data):
+    """Modbus CRC16，返回低字节在前的2字节"""
+    crc = 0xFFFF
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            if crc & 1:
+                crc = (crc >> 1) ^ 0xA001
+            else:
+                crc >>= 1
+    return struct.pack("<H", crc)
+
+
+class ChargeCurve(object):
+    """单体电压曲线：按指数趋近从起始电压变化到终止电压，单位mV"""
+
+    def __init__(self, start_mv=3100, end_mv=3600, duration=36000, mode="charge"):
+        """
+        :param duration: 模拟时间(秒)内到达终止电压的95%
+        :param mode: charge充电/discharge放电，放电时起止电压互换
+        """
+        if mode == "discharge":
+            start_mv, end_mv = end_mv, start_mv
+        self.start_mv = start_mv
+        self.end_mv = end_mv
+        self.tau = duration / 3.0
+
+    def voltage(self, sim_time):
+        return self.end_mv - (self.end_mv - self.start_mv) * math.exp(-sim_time / self.tau)
+
+
+class UnitModel(object):
+    """单台UPS的寄存器模型"""
+
+    def __init__(self, curve, noise_mv=2.0, cell_offsets_mv=None, open_cells=(), open_temps=(), capacity=60):
+        """
+        :param curve: ChargeCurve
+        :param noise_mv: 单体电压随机噪声(mV)
+        :param cell_offsets_mv: 各单体电压固定偏差(mV)，默认随机±5mV
+        :param open_cells: 电压采集开路的单体编号(1-16)
+        :param open_temps: 温度采集开路的单体编号(1-16)
+        """
+        self.curve = curve
+        self.noise_mv = noise_mv
+        self.cell_offsets_mv = cell_offsets_mv or [random.uniform(-5, 5) for _ in range(CELL_COUNT)]
+        self.open_cells = set(open_cells)
+        self.open_temps = set(open_temps)
+        self.capacity = capacity
+        # 主站写入的寄存器，优先于模型值
+        self.written = {}
+
+    def registers(self, sim_time):
+        """return: {寄存器地址: 值}"""
+        values = {address: 0 for address in range(CELL_COUNT_ADDR, LAST_ADDR + 1)}
+        base_mv = self.curve.voltage(sim_time)
+        charging = self.curve.end_mv >= self.curve.start_mv
+        progress = (base_mv - 3000) / 600.0
+        values[CELL_COUNT_ADDR] = CELL_COUNT
+        values[CAPACITY_ADDR] = self.capacity
+        values[CALIBRATED_ADDR] = 1
+        values[REAL_CAPACITY_ADDR] = int(max(0.0, min(1.0, progress)) * self.capacity)
+        values[POWER_STATE_ADDR] = 1 if charging else 0
+        values[AC_FREQUENCY_ADDR] = 50
+        values[AC_VOLTAGE_ADDR] = 220
+        values[CHARGE_CURRENT_ADDR] = 10 if charging else 0
+        values[DISCHARGE_CURRENT_ADDR] = 0 if charging else 10
+        values[INSULATION_ADDR] = 500
+        open_voltage = 0
+        open_temperature = 0
+        total = 0
+        for cell in range(CELL_COUNT):
+            if cell + 1 in self.open_cells:
+                open_voltage |= 1 << cell
+                cell_mv = 0
+            else:
+                cell_mv = int(base_mv + self.cell_offsets_mv[cell] + random.gauss(0, self.noise_mv))
+            values[CELL_VOLTAGE_ADDR + cell] = cell_mv
+            total += cell_mv
+            if cell + 1 in self.open_temps:
+                open_temperature |= 1 << cell
+                values[TEMPERATURE_ADDR + cell] = 0
+            else:  # 0.1℃，充电时缓慢升温
+                values[TEMPERATURE_ADDR + cell] = int(250 + 50 * max(0.0, progress) + random.gauss(0, 3))
+        values[OPEN_VOLTAGE_ADDR] = open_voltage
+        values[OPEN_TEMPERATURE_ADDR] = open_temperature
+        values[TOTAL_VOLTAGE_ADDR] = total & 0xFFFF
+        values.update(self.written)
+        return values
+
+
+class UPS3072Simulator(object):
+    def __init__(self, units, accel=1.0, timeout_rate=0.0, crc_error_rate=0.0, baud_rate=0):
+        """
+        :param units: {从站地址: UnitModel}
+        :param accel: 时间加速倍数，模拟时间 = 实际运行时间 * accel
+        :param timeout_rate: 不响应请求的概率
+        :param crc_error_rate: 响应CRC错误的概率
+        :param baud_rate: 模拟串口线速，按10位/字符延时收发，0表示不模拟
+        """
+        self.units = units
+        self.baud_rate = baud_rate
+        self.accel = accel
+        self.timeout_rate = timeout_rate
+        self.crc_error_rate = crc_error_rate
+        self.master_fd = None
+        self.slave_fd = None
+        self.port = None
+        self.start_time = None
+        self.thread = None
+        self.running = False
+        self.requests = 0
+
+    def sim_time(self):
+        """模拟时间(秒)"""
+        return (time.monotonic() - self.start_time) * self.accel
+
+    def start(self):
+        """创建伪终端并在后台线程中响应请求，return: 主站使用的串口路径"""
+        self.master_fd, self.slave_fd = os.openpty()
+        tty.setraw(self.slave_fd)
+        self.port = os.ttyname(self.slave_fd)
+        self.start_time = time.monotonic()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="ups3072-simulator", daemon=True)
+        self.thread.start()
+        logger.info(f"模拟器已启动:{self.port},从站{sorted(self.units)},加速{self.accel}倍")
+        return self.port
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=1)
+            self.thread = None
+        for fd in (self.master_fd, self.slave_fd):
+            if fd is not None:
+                os.close(fd)
+        self.master_fd = self.slave_fd = None
+        logger.info("模拟器已停止")
+
+    def _run(self):
+        buffer = b""
+        while self.running:
+            readable, _, _ = select.select([self.master_fd], [], [], 0.05)
+            if not readable:
+                buffer = b""  # 帧间静默，丢弃不完整的数据
+                continue
+            buffer += os.read(self.master_fd, 256)
+            while True:
+                length = self._request_length(buffer)
+                if length is None or len(buffer) < length:
+                    break
+                request, buffer = buffer[:length], buffer[length:]
+                response = self.handle(request)
+                if response:
+                    if self.baud_rate:  # 请求和响应在线路上的传输时间
+                        time.sleep((len(request) + len(response)) * 10 / self.baud_rate)
+                    os.write(self.master_fd, response)
+
+    @staticmethod
+    def _request_length(buffer):
+        """按功能码计算请求帧长度，数据不足时返回None"""
+        if len(buffer) < 2:
+            return None
+        if buffer[1] == 16:
+            return 9 + buffer[6] if len(buffer) >= 7 else None
+        return 8
+
+    def handle(self, request):
+        """处理一帧请求，return: 响应帧，不响应时返回None"""
+        if crc16(request[:-2]) != request[-2:]:
+            logger.warning(f"请求CRC错误:{request.hex()}")
+            return None
+        slave, function_code = request[0], request[1]
+        unit = self.units.get(slave)
+        if unit is None:
+            return None
+        self.requests += 1
+        if random.random() < self.timeout_rate:  # 模拟超时
+            return None
+        if function_code == 3:
+            address, quantity = struct.unpack(">HH", request[2:6])
+            registers = unit.registers(self.sim_time())
+            if not 1 <= quantity <= 125 or address < CELL_COUNT_ADDR or address + quantity - 1 > LAST_ADDR:
+                body = bytes([slave, 0x83, 2])
+            else:
+                values = [registers[address + i] & 0xFFFF for i in range(quantity)]
+                body = bytes([slave, 3, 2 * quantity]) + struct.pack(f">{quantity}H", *values)
+        elif function_code == 6:
+            address, value = struct.unpack(">HH", request[2:6])
+            unit.written[address] = value
+            body = request[:6]
+        elif function_code == 16:
+            address, quantity = struct.unpack(">HH", request[2:6])
+            values = struct.unpack(f">{quantity}H", request[7:7 + 2 * quantity])
+            for i, value in enumerate(values):
+                unit.written[address + i] = value
+            body = request[:6]
+        else:
+            body = bytes([slave, function_code | 0x80, 1])
+        crc = crc16(body)
+        if random.random() < self.crc_error_rate:  # 模拟CRC错误
+            crc = bytes([crc[0] ^ 0xFF, crc[1]])
+        return body + crc
+
+
+def parse_numbers(text):
+    """"1,2,3" -> [1, 2, 3]"""
+    return [int(item) for item in text.split(",") if item.strip()] if text else []
+
+
+def main():
+    parser = argparse.ArgumentParser(description="UPS3072 Modbus RTU从站模拟器")
+    parser.add_argument("--slaves", default="1", help="从站地址，逗号分隔")
+    parser.add_argument("--mode", default="charge", choices=["charge", "discharge"])
+    parser.add_argument("--start-mv", type=float, default=3100)
+    parser.add_argument("--end-mv", type=float, default=3600)
+    parser.add_argument("--duration", type=float, default=36000, help="模拟时间内到达终止电压的95%%(秒)")
+    parser.add_argument("--accel", type=float, default=1.0, help="时间加速倍数")
+    parser.add_argument("--noise-mv", type=float, default=2.0)
+    parser.add_argument("--open-cells", default="", help="电压采集开路的单体编号，逗号分隔")
+    parser.add_argument("--open-temps", default="", help="温度采集开路的单体编号，逗号分隔")
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--crc-error-rate", type=float, default=0.0)
+    parser.add_argument("--baud", type=int, default=0, help="模拟串口线速，0表示不模拟")
+    args = parser.parse_args()
+    units = {}
+    for slave in parse_numbers(args.slaves):
+        curve = ChargeCurve(args.start_mv, args.end_mv, args.duration, args.mode)
+        units[slave] = UnitModel(curve, args.noise_mv, open_cells=parse_numbers(args.open_cells),
+                                 open_temps=parse_numbers(args.open_temps))
+    simulator = UPS3072Simulator(units, args.accel, args.timeout_rate, args.crc_error_rate, args.baud)
+    port = simulator.start()
+    print(f"模拟器串口:{port}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        simulator.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+# -- coding: utf-8 --
+# @info:
+# @Author : liyahui
+# @Time : 2023/7/13 上午10:30
+# @File : virtual_table.py
+# @Software: PyCharm
+
+"""虚拟表格：数据全部保存在模型中，Treeview只保留当前可见的一屏行，滚动时按偏移量换入；排序、过滤在模型上完成"""
+import tkinter as tk
+from tkinter import ttk
+
+
+def sort_key(value):
+    """数字按数值排序并排在文本前"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return 0, value, ""
+    return 1, 0, str(value)
+
+
+class VirtualTable(tk.Frame):
+    def __init__(self, master, height=20, selectmode="browse", sortable=True, column_width=100):
+        """
+        :param height: 可见行数，Treeview中始终最多只有这么多行
+        :param selectmode: browse单选 / extended多选
+        :param sortable: 点击表头是否排序
+        """
+        super().__init__(master)
+        self.height = height
+        self.selectmode = selectmode
+        self.sortable = sortable
+        self.column_width = column_width
+        self.headings = []
+        # 模型：全部行；view：过滤、排序后的行号
+        self.rows = []
+        self.view = []
+        self.offset = 0
+        self.selected = set()
+        self.anchor = None
+        self.sort_column = None
+        self.sort_reverse = False
+        self.filter_text = ""
+        self.tree = ttk.Treeview(self, height=height, show="headings", selectmode=selectmode)
+        self.tree.configure(style='Treeview')
+        self.tree.grid(row=0, column=0, sticky="nwse")
+        self.scrollbar = ttk.Scrollbar(self, orient='vertical', command=self.yview)
+        self.scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        self.x_scrollbar = ttk.Scrollbar(self, orient='horizontal', command=self.tree.xview)
+        self.x_scrollbar.grid(row=1, column=0, sticky=(tk.W, tk.E))
+        self.tree.configure(xscrollcommand=self.x_scrollbar.set)
+        self.rowconfigure(0, weight=1)
+        self.columnconfigure(0, weight=1)
+        self.tree.bind("<MouseWheel>", self.on_mouse_wheel)
+        self.tree.bind("<Button-4>", lambda event: self.scroll(-3))
+        self.tree.bind("<Button-5>", lambda event: self.scroll(3))
+        self.tree.bind("<Prior>", lambda event: self.scroll(-self.height) or "break")
+        self.tree.bind("<Next>", lambda event: self.scroll(self.height) or "break")
+        self.tree.bind("<Up>", lambda event: self.move_selection(-1) or "break")
+        self.tree.bind("<Down>", lambda event: self.move_selection(1) or "break")
+        self.tree.bind("<<TreeviewSelect>>", self.on_select)
+
+    def set_columns(self, headings, widths=None):
+        """设置列，列id为序号"""
+        self.headings = list(headings)
+        self.sort_column, self.sort_reverse = None, False
+        self.tree['columns'] = tuple(range(len(self.headings)))
+        for i, text in enumerate(self.headings):
+            self.tree.heading(i, text=text, command=(lambda column=i: self.sort(column)) if self.sortable else "")
+            width = widths[i] if widths and i < len(widths) else self.column_width
+            self.tree.column(i, width=width, stretch=False)
+
+    def set_rows(self, rows):
+        """替换全部数据，保留当前排序和过滤条件"""
+        self.rows = [list(row) for row in rows]
+        self.selected = set()
+        self.anchor = None
+        self.offset = 0
+        self.rebuild()
+
+    def update_cell(self, row_index, column, value):
+        """修改模型中的单元格，可见时同步到Treeview"""
+        self.rows[row_index][column] = value
+        iid = str(row_index)
+        if self.tree.exists(iid):
+            self.tree.set(iid, column, value)
+
+    def clear(self):
+        self.rows = []
+        self.set_columns([])
+        self.rebuild()
+
+    def set_filter(self, text):
+        """按文本过滤，任一单元格包含该文本即显示"""
+        self.filter_text = text.strip()
+        self.offset = 0
+        self.rebuild()
+
+    def sort(self, column):
+        """按列排序，再次点击同一列反向"""
+        if self.sort_column == column:
+            self.sort_reverse = not self.sort_reverse
+        else:
+            self.sort_column, self.sort_reverse = column, False
+        for i, text in enumerate(self.headings):
+            mark = ("▼" if self.sort_reverse else "▲") if i == column else ""
+            self.tree.heading(i, text=f"{text}{mark}")
+        self.rebuild()
+
+    def rebuild(self):
+        """重新计算过滤、排序后的行号"""
+        view = range(len(self.rows))
+        if self.filter_text:
+            view = [i for i in view if any(self.filter_text in str(value) for value in self.rows[i])]
+        if self.sort_column is not None:
+            column = self.sort_column
+            view = sorted(view, key=lambda i: sort_key(self.rows[i][column] if column < len(self.rows[i]) else ""),
+                          reverse=self.sort_reverse)
+        self.view = list(view)
+        self.refresh()
+
+    def refresh(self):
+        """只把当前窗口内的行放入Treeview"""
+        self.offset = max(0, min(self.offset, len(self.view) - self.height))
+        self.tree.delete(*self.tree.get_children())
+        window = self.view[self.offset:self.offset + self.height]
+        for row_index in window:
+            self.tree.insert("", tk.END, iid=str(row_index), values=self.rows[row_index])
+        visible = [str(i) for i in window if i in self.selected]
+        self.tree.selection_set(visible)
+        if self.view:
+            self.scrollbar.set(self.offset / len(self.view), (self.offset + len(window)) / len(self.view))
+        else:
+            self.scrollbar.set(0, 1)
+
+    def yview(self, *args):
+        """滚动条回调：moveto fraction / scroll n units|pages"""
+        if args[0] == "moveto":
+            self.offset = int(float(args[1]) * len(self.view))
+            self.refresh()
+        elif args[0] == "scroll":
+            step = int(args[1]) * (self.height if args[2] == "pages" else 1)
+            self.scroll(step)
+
+    def scroll(self, step):
+        self.offset += step
+        self.refresh()
+
+    def on_mouse_wheel(self, event):
+        self.scroll(-3 if event.delta > 0 else 3)
+        return "break"
+
+    def on_select(self, event=None):
+        """Treeview中的选择同步到模型，滚出窗口的已选行保持选中"""
+        window = set(int(iid) for iid in self.tree.get_children())
+        chosen = set(int(iid) for iid in self.tree.selection())
+        if self.selectmode == "browse":
+            if chosen:
+                self.selected = chosen
+        else:
+            self.selected = (self.selected - window) | chosen
+        if chosen:
+            self.anchor = self.view.index(next(iter(chosen)))
+
+    def move_selection(self, step):
+        """上下键移动选中行，超出窗口时滚动"""
+        if not self.view:
+            return
+        position = 0 if self.anchor is None else max(0, min(len(self.view) - 1, self.anchor + step))
+        self.anchor = position
+        self.selected = {self.view[position]}
+        if position < self.offset:
+            self.offset = position
+        elif position >= self.offset + self.height:
+            self.offset = position - self.height + 1
+        self.refresh()
+        self.tree.event_generate("<<TreeviewSelect>>")
+
+    def selection(self):
+        """return: 选中的模型行，按当前显示顺序"""
+        return [self.rows[i] for i in self.view if i in self.selected]
@@ -0,0 +1,67 @@
+# -- coding: utf-8 --
+# @info:
+# @Author : liyahui
+# @Time : 2023/6/13 下午2:10
+# @File : wait_scheduler.py
+# @Software: PyCharm
+
+"""节点等待调度：根据已采集的电压斜率估算到达节点的时间，远离节点时低频轮询，接近节点时高频轮询"""
+import time
+from collections import deque
+
+
+class NodeWaitScheduler(object):
+    def __init__(self, target, min_interval=0.5, max_interval=60.0, window=20, approach_ratio=0.5):
+        """
+        :param target: 期望节点值
+        :param min_interval: 最小轮询间隔(秒)
+        :param max_interval: 最大轮询间隔(秒)
+        :param window: 参与斜率估算的采样点数
+        :param approach_ratio: 下次轮询间隔占预计剩余时间的比例，越小越不容易越过节点
+        """
+        self.target = float(target)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.approach_ratio = approach_ratio
+        self.samples = deque(maxlen=window)
+
+    def update(self, value, timestamp=None):
+        """记录一次采样值"""
+        if timestamp is None:
+            timestamp = time.monotonic()
+        self.samples.append((timestamp, float(value)))
+
+    def slope(self):
+        """最小二乘估算电压变化斜率(单位/秒)，采样不足时返回None"""
+        if len(self.samples) < 2:
+            return None
+        n = len(self.samples)
+        t0 = self.samples[0][0]
+        t_mean = sum(t - t0 for t, _ in self.samples) / n
+        v_mean = sum(v for _, v in self.samples) / n
+        numerator = sum((t - t0 - t_mean) * (v - v_mean) for t, v in self.samples)
+        denominator = sum((t - t0 - t_mean) ** 2 for t, _ in self.samples)
+        if denominator == 0:
+            return None
+        return numerator / denominator
+
+    def eta(self):
+        """预计到达节点的剩余秒数，电压不上升或无法估算时返回None"""
+        if not self.samples:
+            return None
+        remaining = self.target - self.samples[-1][1]
+        if remaining <= 0:
+            return 0.0
+        slope = self.slope()
+        if not slope or slope <= 0:
+            return None
+        return remaining / slope
+
+    def next_interval(self):
+        """下次轮询间隔(秒)"""
+        eta = self.eta()
+        if eta is None:
+            if len(self.samples) < 2:  # 刚开始等待，先按最小间隔采样以便尽快估算斜率
+                return self.min_interval
+            return self.max_interval
+        return min(self.max_interval, max(self.min_interval, eta * self.approach_ratio))